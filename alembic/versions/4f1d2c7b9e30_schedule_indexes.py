@@ -0,0 +1,47 @@
+"""schedule indexes
+
+Revision ID: 4f1d2c7b9e30
+Revises: 81e60cacccb2
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1d2c7b9e30'
+down_revision = '81e60cacccb2'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_playbacks_adspot_id', 'playbacks', ['adspot_id']),
+    ('ix_playbacks_timeslot_id', 'playbacks', ['timeslot_id']),
+    ('ix_playbacks_creative_id', 'playbacks', ['creative_id']),
+    ('ix_timeslots_from_time', 'timeslots', ['from_time']),
+    ('ix_timeslots_to_time', 'timeslots', ['to_time']),
+    ('ix_creatives_advert_id', 'creatives', ['advert_id']),
+]
+
+
+def upgrade():
+    # CONCURRENTLY keeps the tables writable, but can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+        op.create_index(
+            'ix_playbacks_pending',
+            'playbacks',
+            ['timeslot_id'],
+            postgresql_where=sa.text('smart_contract IS NOT NULL AND processed_at IS NULL'),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_playbacks_pending', 'playbacks', postgresql_concurrently=True)
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table, postgresql_concurrently=True)
@@ -0,0 +1,85 @@
+"""playbacks booked_during exclusion
+
+Revision ID: b7e25d1c8f43
+Revises: 4f1d2c7b9e30
+Create Date: 2026-10-18 14:41:07.512930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e25d1c8f43'
+down_revision = '4f1d2c7b9e30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # btree_gist provides the GiST `=` operator class for adspot_id
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('playbacks', sa.Column('booked_during', postgresql.TSRANGE(), nullable=True))
+    op.execute(
+        'UPDATE playbacks SET booked_during = tsrange(timeslots.from_time, timeslots.to_time) '
+        'FROM timeslots WHERE timeslots.id = playbacks.timeslot_id'
+    )
+    # Bookings made before the constraint may overlap, they have to be resolved by hand
+    overlaps = op.get_bind().execute(sa.text(
+        'SELECT earlier.id, later.id FROM playbacks AS earlier '
+        'JOIN playbacks AS later ON later.adspot_id = earlier.adspot_id '
+        'AND later.id > earlier.id AND later.booked_during && earlier.booked_during '
+        'ORDER BY earlier.id, later.id'
+    )).all()
+    if overlaps:
+        raise RuntimeError(
+            'Overlapping bookings of an adspot must be deleted or moved before the upgrade, '
+            'playback id pairs: ' + ', '.join(f'{earlier}/{later}' for earlier, later in overlaps)
+        )
+    # booked_during is derived from the timeslot, whatever inserts or moves the booking
+    op.execute("""
+        CREATE FUNCTION playbacks_set_booked_during() RETURNS trigger AS $$
+        BEGIN
+            SELECT tsrange(from_time, to_time) INTO NEW.booked_during
+            FROM timeslots WHERE id = NEW.timeslot_id;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER playbacks_set_booked_during
+        BEFORE INSERT OR UPDATE OF timeslot_id, booked_during ON playbacks
+        FOR EACH ROW EXECUTE FUNCTION playbacks_set_booked_during()
+    """)
+    op.execute("""
+        CREATE FUNCTION timeslots_update_booked_during() RETURNS trigger AS $$
+        BEGIN
+            UPDATE playbacks SET booked_during = tsrange(NEW.from_time, NEW.to_time)
+            WHERE timeslot_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER timeslots_update_booked_during
+        AFTER UPDATE OF from_time, to_time ON timeslots
+        FOR EACH ROW EXECUTE FUNCTION timeslots_update_booked_during()
+    """)
+    op.alter_column('playbacks', 'booked_during', nullable=False)
+    op.create_exclude_constraint(
+        'playbacks_booked_during_excl',
+        'playbacks',
+        ('adspot_id', '='),
+        ('booked_during', '&&'),
+        using='gist',
+    )
+
+
+def downgrade():
+    op.drop_constraint('playbacks_booked_during_excl', 'playbacks')
+    op.execute('DROP TRIGGER timeslots_update_booked_during ON timeslots')
+    op.execute('DROP FUNCTION timeslots_update_booked_during()')
+    op.execute('DROP TRIGGER playbacks_set_booked_during ON playbacks')
+    op.execute('DROP FUNCTION playbacks_set_booked_during()')
+    op.drop_column('playbacks', 'booked_during')
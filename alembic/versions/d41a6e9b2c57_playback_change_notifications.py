@@ -0,0 +1,74 @@
+"""playback change notifications
+
+Revision ID: d41a6e9b2c57
+Revises: b7e25d1c8f43
+Create Date: 2026-10-18 15:02:19.847311
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a6e9b2c57'
+down_revision = 'b7e25d1c8f43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NOTIFY payloads are delivered on commit, duplicates within a transaction are folded
+    op.execute("""
+        CREATE FUNCTION notify_playback_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM pg_notify('playback_changes', json_build_object(
+                    'playback_id', OLD.id, 'adspot_id', OLD.adspot_id)::text);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM pg_notify('playback_changes', json_build_object(
+                    'playback_id', NEW.id, 'adspot_id', NEW.adspot_id)::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE FUNCTION notify_timeslot_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('playback_changes', json_build_object(
+                'playback_id', playbacks.id, 'adspot_id', playbacks.adspot_id)::text)
+            FROM playbacks WHERE playbacks.timeslot_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER playbacks_notify_insert_delete
+        AFTER INSERT OR DELETE ON playbacks
+        FOR EACH ROW EXECUTE FUNCTION notify_playback_changed()
+    """)
+    # The dispatcher's own taken_at/processed_at marks are not announced
+    op.execute("""
+        CREATE TRIGGER playbacks_notify_update
+        AFTER UPDATE ON playbacks
+        FOR EACH ROW WHEN (
+            OLD.smart_contract IS DISTINCT FROM NEW.smart_contract
+            OR OLD.adspot_id IS DISTINCT FROM NEW.adspot_id
+            OR OLD.timeslot_id IS DISTINCT FROM NEW.timeslot_id
+            OR OLD.creative_id IS DISTINCT FROM NEW.creative_id
+        )
+        EXECUTE FUNCTION notify_playback_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER timeslots_notify_update
+        AFTER UPDATE OF from_time, to_time ON timeslots
+        FOR EACH ROW EXECUTE FUNCTION notify_timeslot_changed()
+    """)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER timeslots_notify_update ON timeslots')
+    op.execute('DROP TRIGGER playbacks_notify_update ON playbacks')
+    op.execute('DROP TRIGGER playbacks_notify_insert_delete ON playbacks')
+    op.execute('DROP FUNCTION notify_timeslot_changed()')
+    op.execute('DROP FUNCTION notify_playback_changed()')
@@ -0,0 +1,35 @@
+"""playbacks task leases
+
+Revision ID: e5a93c7f1b08
+Revises: d41a6e9b2c57
+Create Date: 2026-10-18 15:02:19.604817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a93c7f1b08'
+down_revision = 'd41a6e9b2c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('playbacks', sa.Column('leased_by', sa.String(), nullable=True))
+    op.add_column('playbacks', sa.Column('leased_until', sa.DateTime(), nullable=True))
+    op.add_column('playbacks', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+    op.create_index(
+        'ix_playbacks_leased_by',
+        'playbacks',
+        ['leased_by'],
+        postgresql_where=sa.text('leased_by IS NOT NULL'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_playbacks_leased_by', 'playbacks')
+    op.drop_column('playbacks', 'heartbeat_at')
+    op.drop_column('playbacks', 'leased_until')
+    op.drop_column('playbacks', 'leased_by')
@@ -1,3 +1,4 @@
+import datetime
 import signal
 
 import tornado.ioloop
@@ -5,11 +6,16 @@ import tornado.web
 
 import root
 import root.enums as enums
+import root.models as models
+from root.auth import SignerPool
+import root.slot_index as slot_index
+from root.slot_index import SlotIndexListener
 from root.handlers import *
 from root.log_lib import get_logger
 
 logger = get_logger('API')
 loop = tornado.ioloop.IOLoop.current()
+SLOT_INDEX_PRUNE_INTERVAL = 3600  # sec
 
 
 def all_handlers():
@@ -28,13 +34,22 @@ def all_handlers():
                         TimeSlotsHandler, name=enums.UrlName.TIMESLOTS.value),  # TODO: Remove
         tornado.web.url(fr"{root.context.uri_prefix}" + r"/timeslots/date/([0-9]{4}-[0-9]{2}-[0-9]{2})",
                         TimeSlotsDateHandler, name=enums.UrlName.TIMESLOTS_DATE.value),  # TODO: Remove
+        tornado.web.url(fr"{root.context.uri_prefix}" +
+                        r"/timeslots/date/([0-9]{4}-[0-9]{2}-[0-9]{2})/([0-9]{4}-[0-9]{2}-[0-9]{2})",
+                        TimeSlotsDateHandler, name=enums.UrlName.TIMESLOTS_DATE_RANGE.value),
         tornado.web.url(fr"{root.context.uri_prefix}/timeslots_by_adspot/id/([0-9]+)",
                         TimeslotsByAdspotId, name=enums.UrlName.TIMESLOTS_BY_ADSPOT_ID.value),
         tornado.web.url(fr"{root.context.uri_prefix}" +
                         r"/timeslots_by_adspot/id/([0-9]+)/date/([0-9]{4}-[0-9]{2}-[0-9]{2})",
                         TimeslotsByAdspotId, name=enums.UrlName.TIMESLOTS_BY_ADSPOT_ID_DATE.value),
+        tornado.web.url(fr"{root.context.uri_prefix}" +
+                        r"/timeslots_by_adspot/id/([0-9]+)/date/([0-9]{4}-[0-9]{2}-[0-9]{2})"
+                        r"/([0-9]{4}-[0-9]{2}-[0-9]{2})",
+                        TimeslotsByAdspotId, name=enums.UrlName.TIMESLOTS_BY_ADSPOT_ID_DATE_RANGE.value),
         tornado.web.url(fr"{root.context.uri_prefix}/playbacks",
                         PlaybacksHandler, name=enums.UrlName.PLAYBACKS.value),
+        tornado.web.url(fr"{root.context.uri_prefix}/playbacks/bulk",
+                        PlaybacksBulkHandler, name=enums.UrlName.PLAYBACKS_BULK.value),
         tornado.web.url(fr"{root.context.uri_prefix}/playback",
                         PlaybacksHandler, name=enums.UrlName.PLAYBACK.value),
         tornado.web.url(fr"{root.context.uri_prefix}/playback/id/([0-9]+)",
@@ -48,9 +63,38 @@ def all_handlers():
     ]
 
 
-def stop():
+signer_pool = SignerPool(root.context.auth_workers)
+slot_index_listener: 'SlotIndexListener' = None
+
+
+def load_bookings(ending_after: datetime.datetime) -> list['root.dc.Booking']:
+    with root.context.sc as sc:
+        return root.MS(sc.session).get_bookings(ending_after)
+
+
+def prune_slot_index():
+    pruned = root.context.slot_index.prune(slot_index.horizon())
+    if pruned:
+        logger.info(f'Slot index pruned: {pruned} ended bookings')
+
+
+def log_stats(db_controller: 'root.db_controller.DBController'):
+    db_controller.log_pool_stats()
+    if root.context.executor is not None:
+        logger.info(f'Executor stats: {root.context.executor.stats}')
+    if root.context.auth_workers:
+        logger.info(f'Signer pool stats: {signer_pool.stats}')
+    logger.info(f'Token cache stats: {root.context.token_cache.stats}')
+    logger.info(f'Identity cache stats: {root.context.identity_cache.stats}')
+    logger.info(f'Response cache stats: {root.context.response_cache.stats}')
+
+
+async def stop():
     logger.info('Stopping application...')
-    root.context.stop()
+    signer_pool.stop()
+    if slot_index_listener is not None:
+        slot_index_listener.stop()
+    await root.context.async_stop()
     loop.stop()
     logger.info('Stopped.')
 
@@ -83,13 +127,30 @@ def log_function(handler):
 
 
 def start(port: int = 5000):
+    global slot_index_listener
     app = make_app()
     app.listen(port)
 
-    root.context.load_db_controller()
+    db_controller = root.context.load_db_controller()
+    root.context.response_cache.watch(
+        models.AdSpot,
+        models.AdSpotsStats,
+        models.Publisher,
+        models.AdSpotType,
+    )
+    if root.context.slot_index is not None:
+        slot_index_listener = SlotIndexListener(root.context.slot_index, db_controller.engine, load_bookings)
+        slot_index_listener.start()
+        tornado.ioloop.PeriodicCallback(prune_slot_index, SLOT_INDEX_PRUNE_INTERVAL * 1000).start()
+    if root.context.db_config.stats_interval:
+        tornado.ioloop.PeriodicCallback(
+            lambda: log_stats(db_controller),
+            root.context.db_config.stats_interval * 1000,
+        ).start()
 
     app.settings.update({
-        # 'executor': root.context.executor,
+        'executor': root.context.executor,
+        'signer_pool': signer_pool if root.context.auth_workers else None,
         'log_function': log_function,
         'context': root.context,
         'logger': logger,
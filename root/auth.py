@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timezone
+from typing import Optional
+
+from web3_token import Web3Token
+import root.data_classes as dc
+import root.utils as utils
+from root.cache import TTLCache
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def verify_token(token: str) -> 'dc.VerifiedToken':
+    """
+    Recover the signer of a raw `Authorization` token and parse its data.
+    """
+    wt = Web3Token(token)
+    signer = wt.get_signer(validate=True)
+    token_data = wt.get_data()
+    return dc.VerifiedToken(
+        wt.statement,
+        signer,
+        token_data,
+        utils.proper_utc_date(token_data['Expiration Time']),
+    )
+
+
+def _expires_ts(verified: 'dc.VerifiedToken') -> float:
+    return verified.expires_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def get_verified_token(token: str, cache: 'TTLCache') -> 'dc.VerifiedToken':
+    """
+    Same as `verify_token`, but remembers the result until the token expires.
+    """
+    key = token_digest(token)
+    verified = cache.get(key)
+    if verified is None:
+        verified = verify_token(token)
+        cache.set(key, verified, _expires_ts(verified))
+    return verified
+
+
+async def get_verified_token_async(
+        token: str,
+        cache: 'TTLCache',
+        pool: Optional['SignerPool'] = None,
+) -> 'dc.VerifiedToken':
+    """
+    Same as `get_verified_token`, but the signature recovery runs in `pool`
+    instead of blocking the IOLoop.
+    """
+    if pool is None:
+        return get_verified_token(token, cache)
+    key = token_digest(token)
+    verified = cache.get(key)
+    if verified is None:
+        verified = await pool.verify(token)
+        cache.set(key, verified, _expires_ts(verified))
+    return verified
+
+
+class SignerPool:
+    """
+    Process pool for CPU-bound token signature recovery.
+    Concurrent verifications of the same token share one pool job.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.__executor: Optional[ProcessPoolExecutor] = None
+        self.__in_flight: dict[str, 'asyncio.Future[dc.VerifiedToken]'] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(self.max_workers)
+        return self.__executor
+
+    @property
+    def stats(self) -> 'dc.PoolStats':
+        in_flight = len(self.__in_flight)
+        return dc.PoolStats(
+            self.max_workers,
+            in_flight,
+            max(in_flight - self.max_workers, 0),
+        )
+
+    async def verify(self, token: str) -> 'dc.VerifiedToken':
+        key = token_digest(token)
+        future = self.__in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, verify_token, token
+            )
+            self.__in_flight[key] = future
+            future.add_done_callback(lambda _: self.__in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stop(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import root.data_classes as dc
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry expiration.
+    Entries are evicted in least-recently-used order once `max_size` is reached
+    and dropped lazily on lookup after their `expires_at` (unix timestamp).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__data: 'OrderedDict[Hashable, tuple[Optional[float], Any]]' = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.__lock:
+            item = self.__data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at is None or expires_at > time.time():
+                    self.__data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        if self.ttl is not None:
+            ttl_expires_at = time.time() + self.ttl
+            expires_at = ttl_expires_at if expires_at is None else min(expires_at, ttl_expires_at)
+        if expires_at is not None and expires_at <= time.time():
+            return
+        with self.__lock:
+            self.__data[key] = (expires_at, value)
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.max_size:
+                self.__data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self.__lock:
+            item = self.__data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__data.clear()
+
+    @property
+    def stats(self) -> 'dc.CacheStats':
+        return dc.CacheStats(len(self.__data), self.max_size, self.hits, self.misses)
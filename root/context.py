@@ -5,7 +5,11 @@ from typing import Any, Optional
 import yaml
 import root.data_classes as dc
 
-from root.db_controller import DBController, WithSessionContextManager
+from root.cache import TTLCache
+from root.executor import MSExecutor
+from root.response_cache import ResponseCache
+from root.slot_index import SlotIndex
+from root.db_controller import DBController, WithSessionContextManager, AsyncWithSessionContextManager
 
 
 class Context:
@@ -36,10 +40,45 @@ class Context:
         self.jwt_algorithm: str = self.config['jwt_algorithm']
         self.user_session_timeout: int = self.config['user_session_timeout']
         self.max_timeslot_duration: int = self.config.get('max_timeslot_duration', 60)
+        self.default_page_size: int = self.config.get('default_page_size', 100)
+        self.max_page_size: int = self.config.get('max_page_size', 1000)
+        self.max_date_range_days: int = self.config.get('max_date_range_days', 31)
+        self.stream_batch_size: int = self.config.get('stream_batch_size', 1000)
+        self.max_bulk_booking_size: int = self.config.get('max_bulk_booking_size', 1000)
+        self.dispatcher_concurrency: int = self.config.get('dispatcher_concurrency', 64)
+        self.dispatcher_request_timeout: float = self.config.get('dispatcher_request_timeout', 10)
+        self.dispatcher_listen: bool = self.config.get('dispatcher_listen', True)
+        self.dispatcher_poll_interval: float = self.config.get('dispatcher_poll_interval', 5)
+        self.dispatcher_safety_poll_interval: float = self.config.get('dispatcher_safety_poll_interval', 60)
+        self.dispatcher_poll_window: float = self.config.get('dispatcher_poll_window', 15)
+        self.dispatcher_worker_id: str = self.config.get('dispatcher_worker_id', '')
+        self.dispatcher_lease_ttl: float = self.config.get('dispatcher_lease_ttl', 30)
+        self.dispatcher_heartbeat_interval: float = self.config.get('dispatcher_heartbeat_interval', 5)
+        self.dispatcher_lease_batch_size: int = self.config.get('dispatcher_lease_batch_size', 100)
+        self.dispatcher_complete_window: float = self.config.get('dispatcher_complete_window', 0.02)
+        self.dispatcher_complete_batch_size: int = self.config.get('dispatcher_complete_batch_size', 500)
         self.near_env: str = self.config['near_env']
         self.near_account_id: str = self.config['near_account_id']
+        self.auth_workers: int = self.config.get('auth_workers', 2)
+        self.token_cache = TTLCache(self.config.get('token_cache_size', 4096))
+        self.identity_cache = TTLCache(
+            self.config.get('identity_cache_size', 4096),
+            self.config.get('identity_cache_ttl', 300),
+        )
+        self.response_cache = ResponseCache(
+            self.config.get('response_cache_size', 256),
+            self.config.get('response_cache_ttl', 60),
+        )
+        self.slot_index: Optional['SlotIndex'] = SlotIndex() if self.config.get('slot_index', True) else None
         db: dict[str, Any] = self.config['db']
         self.db_config = dc.DBConfig(**db)
+        self.executor: Optional['MSExecutor'] = None
+        if self.config.get('use_executor', True):
+            self.executor = MSExecutor.for_db_config(
+                self.db_config,
+                self.config.get('executor_workers'),
+                self.config.get('executor_timeout', 30),
+            )
         self.__db_controller: Optional['DBController'] = None
 
     def load_db_controller(self) -> 'DBController':
@@ -48,9 +87,17 @@ class Context:
         return self.__db_controller
 
     def stop(self) -> None:
+        if self.executor is not None:
+            self.executor.stop()
         if self.__db_controller is not None:
             self.__db_controller.stop()
 
+    async def async_stop(self) -> None:
+        if self.executor is not None:
+            self.executor.stop()
+        if self.__db_controller is not None:
+            await self.__db_controller.async_stop()
+
     @property
     def db_controller(self) -> 'DBController':
         if self.__db_controller is None:
@@ -62,3 +109,8 @@ class Context:
     def sc(self) -> 'WithSessionContextManager':
         db_controller = self.load_db_controller()
         return db_controller.with_sc()
+
+    @property
+    def async_sc(self) -> 'AsyncWithSessionContextManager':
+        db_controller = self.load_db_controller()
+        return db_controller.with_async_sc()
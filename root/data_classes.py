@@ -1,6 +1,6 @@
 import datetime
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Any, Optional
 
 from deeply import Deeply
 
@@ -14,12 +14,34 @@ class DBConfig(Deeply):
     password: str
     pool_size: int = field(default=25)
     max_overflow: int = field(default=100)
+    pool_pre_ping: bool = field(default=True)
+    pool_recycle: int = field(default=1800)
+    pool_timeout: float = field(default=30)
+    statement_timeout: int = field(default=0)
+    stats_interval: int = field(default=60)
+    async_driver: bool = field(default=False)
+    replicas: list[dict[str, Any]] = field(default_factory=list)
+    replica_max_lag: float = field(default=0)
+    replica_lag_check_interval: float = field(default=5)
 
     @property
     def db_con_string(self) -> str:
         return f'postgresql://{self.login}:{self.password}' \
                f'@{self.server}:{self.port}/{self.name}'
 
+    @property
+    def replica_configs(self) -> list['DBConfig']:
+        """Replicas inherit every setting they do not override."""
+        return [
+            DBConfig(**{**self.__dict__, 'replicas': [], **replica})
+            for replica in self.replicas
+        ]
+
+    @property
+    def async_db_con_string(self) -> str:
+        return f'postgresql+asyncpg://{self.login}:{self.password}' \
+               f'@{self.server}:{self.port}/{self.name}'
+
 
 @dataclass
 class AdSpot(Deeply):
@@ -91,6 +113,18 @@ class PlaybackRaw(Deeply):
     processed_at: datetime
 
 
+@dataclass
+class BookingConflict(Deeply):
+    index: int
+    message: str
+
+
+@dataclass
+class BulkBooking(Deeply):
+    data: list[PlaybackRaw]
+    conflicts: list[BookingConflict]
+
+
 @dataclass
 class AdTaskConfig(Deeply):
     name: str
@@ -130,6 +164,29 @@ class TimeSlot(Deeply):
         return self.from_time <= item < self.to_time
 
 
+@dataclass
+class Booking(Deeply):
+    adspot_id: int
+    playback_id: int
+    timeslot_id: int
+    from_time: datetime.datetime
+    to_time: datetime.datetime
+    locked: bool
+
+
+@dataclass
+class Availability(Deeply):
+    """
+    Occupancy of the minutes of [date_from, date_to] (inclusive days)
+    as alternating free/booked run lengths, starting with a free run.
+    """
+    date_from: datetime.date
+    date_to: datetime.date
+    step: int
+    price: float
+    runs: list[int]
+
+
 @dataclass
 class AdSpotTypes(Deeply):
     id: int
@@ -142,6 +199,72 @@ class RequestUser(Deeply):
     meta_mask: str
 
 
+@dataclass
+class VerifiedToken(Deeply):
+    statement: Optional[str]
+    signer: str
+    data: dict[str, str]
+    expires_at: datetime.datetime
+
+    @property
+    def request_user(self) -> 'RequestUser':
+        return RequestUser(self.statement, self.signer)
+
+
+@dataclass
+class CacheStats(Deeply):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+
+
+@dataclass
+class PoolStats(Deeply):
+    max_workers: int
+    in_flight: int
+    queue_depth: int
+
+
+@dataclass
+class ExecutorStats(Deeply):
+    max_workers: int
+    active: int
+    queued: int
+    timeouts: int
+
+
+@dataclass
+class SchedulerStats(Deeply):
+    pending: int
+    dispatched: int
+    max_lateness: float
+    mean_lateness: float
+
+
+@dataclass
+class DBPoolStats(Deeply):
+    size: int
+    checked_out: int
+    overflow: int
+    checked_in: int
+    wait_count: int
+    wait_time: float
+    max_wait_time: float
+
+
+@dataclass
+class CachedResponse(Deeply):
+    etag: str
+    body: bytes
+
+
+@dataclass
+class Page(Deeply):
+    data: list
+    next_cursor: Optional[str]
+
+
 @dataclass
 class UserWeb(Deeply):
     id: int
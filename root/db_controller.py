@@ -1,25 +1,108 @@
 import logging
-from time import sleep
-from typing import Optional
+import itertools
+import threading
+from time import perf_counter, sleep
+from typing import Any, Optional
 
 import sqlalchemy as sa
 from sqlalchemy.orm import Session
 import sqlalchemy.engine as engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
+import root.data_classes as dc
 import root.exceptions as exceptions
 from root.log_lib import get_logger
 
 
+class TimedPoolMixin:
+    """Records how long checkouts wait for a free connection."""
+    wait_count: int = 0
+    wait_time: float = 0.
+    max_wait_time: float = 0.
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = perf_counter() - started
+            self.wait_count += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class Replica:
+    """
+    Read replica engine with the replication lag probed by a background thread,
+    so a slow or unreachable replica never blocks the sessions opening.
+    Until the first probe the replica is not used.
+    """
+
+    LAG_QUERY = sa.text(
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+    )
+
+    def __init__(self, engine_: 'engine.Engine', max_lag: float, check_interval: float):
+        self.engine = engine_
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: float = float('inf') if max_lag else 0.
+        self.__stopped = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+    def check_lag(self) -> float:
+        try:
+            with self.engine.connect() as conn:
+                self.lag = float(conn.execute(self.LAG_QUERY).scalar() or 0)
+        except Exception as ex:
+            logging.warning(f'Replica {self.engine.url!r} lag check failed: {ex}')
+            self.lag = float('inf')
+        return self.lag
+
+    def __probe(self):
+        while not self.__stopped.is_set():
+            self.check_lag()
+            self.__stopped.wait(self.check_interval)
+
+    def start(self):
+        if self.max_lag and self.__thread is None:
+            self.__thread = threading.Thread(target=self.__probe, name='ReplicaLagProbe', daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+
+    @property
+    def available(self) -> bool:
+        return not self.max_lag or self.lag <= self.max_lag
+
+
 class SessionContext:
     __session: 'Session' = None
 
-    def __init__(self, engine_: 'engine.Engine'):
+    def __init__(self, engine_: 'engine.Engine', read_only: bool = False):
         self.__engine: 'engine.Engine' = engine_
+        self.read_only = read_only
 
     @property
     def session(self) -> 'Session':
         if self.__session is None:
-            self.__session = Session(self.__engine, expire_on_commit=False)
+            self.__session = Session(
+                self.__engine,
+                expire_on_commit=False,
+                autoflush=not self.read_only,
+                info={'read_only': self.read_only},
+            )
         return self.__session
 
     @session.setter
@@ -27,6 +110,10 @@ class SessionContext:
         self.__session = session
 
     def close(self):
+        if self.read_only:
+            # Nothing to commit, the transaction is rolled back on connection release
+            self.session.close()
+            return
         try:
             self.session.commit()
         except Exception as ex:
@@ -65,49 +152,255 @@ class SessionContext:
             raise exceptions.APIError(details)
 
 
+class AsyncSessionContext:
+    """Asyncio counterpart of `SessionContext`."""
+    __session: 'AsyncSession' = None
+
+    def __init__(self, engine_: 'AsyncEngine', read_only: bool = False):
+        self.__engine: 'AsyncEngine' = engine_
+        self.read_only = read_only
+
+    @property
+    def session(self) -> 'AsyncSession':
+        if self.__session is None:
+            self.__session = AsyncSession(
+                self.__engine,
+                expire_on_commit=False,
+                autoflush=not self.read_only,
+                info={'read_only': self.read_only},
+            )
+        return self.__session
+
+    @session.setter
+    def session(self, session: 'AsyncSession'):
+        self.__session = session
+
+    async def close(self):
+        if self.read_only:
+            await self.session.close()
+            return
+        try:
+            await self.session.commit()
+        except Exception as ex:
+            logging.warning(
+                'Session commit error, rollback ...\n{}'.format(ex)
+            )
+            await self.session.rollback()
+        finally:
+            await self.session.close()
+
+    async def commit(self):
+        try:
+            await self.session.commit()
+        except Exception as e:
+            if hasattr(e, 'detail'):
+                raise exceptions.APIError(
+                    f'One of arguments are wrong: {e.detail}'
+                )
+            else:
+                raise exceptions.APIError(
+                    f'One of arguments are wrong. '
+                    f'Please make sure you are sending right request.'
+                )
+
+
 class WithSessionContextManager:
-    def __init__(self, db_controller: 'DBController'):
+    def __init__(self, db_controller: 'DBController', read_only: bool = False):
         self.db_controller = db_controller
+        self.read_only = read_only
         self.sc: Optional[SessionContext] = None
         self.__a_session_cm = None
 
     def __enter__(self):
-        self.sc = self.db_controller.make_sc()
+        self.sc = self.db_controller.make_sc(self.read_only)
         return self.sc
 
     def __exit__(self, err_type, err_value, err_traceback):
         self.sc.close()
 
 
+class AsyncWithSessionContextManager:
+    def __init__(self, db_controller: 'DBController', read_only: bool = False):
+        self.db_controller = db_controller
+        self.read_only = read_only
+        self.sc: Optional[AsyncSessionContext] = None
+
+    def enter(self) -> AsyncSessionContext:
+        # Opening the session does no IO, so it is usable from sync code too
+        self.sc = self.db_controller.make_async_sc(self.read_only)
+        return self.sc
+
+    async def __aenter__(self):
+        return self.enter()
+
+    async def __aexit__(self, err_type, err_value, err_traceback):
+        await self.sc.close()
+
+
 class DBController:
     """Database controller."""
 
     __engine: 'engine.Engine' = None
+    __read_only_engine: 'engine.Engine' = None
+    __async_engine: 'AsyncEngine' = None
+    __async_read_only_engine: 'AsyncEngine' = None
+    __replicas: list['Replica'] = None
 
     def __init__(self, context):
         self.logger = get_logger(self.__class__.__name__)
         self.app_context = context
+        self.__replica_cycle = itertools.cycle(range(len(context.db_config.replicas) or 1))
+        self.__replicas_lock = threading.Lock()
         self.logger.debug('DBController started.')
 
+    def engine_options(
+            self,
+            async_driver: bool = False,
+            db_config: Optional['dc.DBConfig'] = None,
+    ) -> dict[str, Any]:
+        db_config = db_config or self.app_context.db_config
+        options = dict(
+            poolclass=TimedAsyncQueuePool if async_driver else TimedQueuePool,
+            pool_size=db_config.pool_size,
+            max_overflow=db_config.max_overflow,
+            pool_pre_ping=db_config.pool_pre_ping,
+            pool_recycle=db_config.pool_recycle,
+            pool_timeout=db_config.pool_timeout,
+        )
+        if db_config.statement_timeout:
+            if async_driver:
+                options['connect_args'] = {
+                    'server_settings': {'statement_timeout': str(db_config.statement_timeout)}
+                }
+            else:
+                options['connect_args'] = {
+                    'options': f'-c statement_timeout={db_config.statement_timeout}'
+                }
+        return options
+
     @property
     def engine(self):
         if self.__engine is None:
             self.__engine = sa.create_engine(
                 self.app_context.db_config.db_con_string,
                 echo=False,
-                encoding='utf-8'
+                encoding='utf-8',
+                **self.engine_options(),
             )
         return self.__engine
 
-    def make_sc(self) -> SessionContext:
+    @property
+    def async_engine(self) -> 'AsyncEngine':
+        if self.__async_engine is None:
+            self.__async_engine = create_async_engine(
+                self.app_context.db_config.async_db_con_string,
+                echo=False,
+                **self.engine_options(async_driver=True),
+            )
+        return self.__async_engine
+
+    @property
+    def read_only_engine(self) -> 'engine.Engine':
+        """Engine sharing the main pool, but opening READ ONLY transactions."""
+        if self.__read_only_engine is None:
+            self.__read_only_engine = self.engine.execution_options(postgresql_readonly=True)
+        return self.__read_only_engine
+
+    @property
+    def replicas(self) -> list['Replica']:
+        if self.__replicas is None:
+            # Sessions are opened from the executor threads, replicas and their probes are made once
+            with self.__replicas_lock:
+                if self.__replicas is None:
+                    db_config: 'dc.DBConfig' = self.app_context.db_config
+                    replicas = [
+                        Replica(
+                            sa.create_engine(
+                                replica_config.db_con_string,
+                                echo=False,
+                                encoding='utf-8',
+                                **self.engine_options(db_config=replica_config),
+                            ).execution_options(postgresql_readonly=True),
+                            db_config.replica_max_lag,
+                            db_config.replica_lag_check_interval,
+                        ) for replica_config in db_config.replica_configs
+                    ]
+                    for replica in replicas:
+                        replica.start()
+                    self.__replicas = replicas
+        return self.__replicas
+
+    def next_read_engine(self) -> 'engine.Engine':
+        """
+        Round-robin over replicas within the allowed lag,
+        falling back to the primary.
+        """
+        replicas = self.replicas
+        for _ in range(len(replicas)):
+            replica = replicas[next(self.__replica_cycle)]
+            if replica.available:
+                return replica.engine
+        return self.read_only_engine
+
+    @property
+    def async_read_only_engine(self) -> 'AsyncEngine':
+        if self.__async_read_only_engine is None:
+            self.__async_read_only_engine = self.async_engine.execution_options(postgresql_readonly=True)
+        return self.__async_read_only_engine
+
+    @staticmethod
+    def _pool_stats(pool: 'TimedPoolMixin | QueuePool') -> 'dc.DBPoolStats':
+        return dc.DBPoolStats(
+            pool.size(),
+            pool.checkedout(),
+            max(pool.overflow(), 0),
+            pool.checkedin(),
+            pool.wait_count,
+            pool.wait_time,
+            pool.max_wait_time,
+        )
+
+    @property
+    def pool_stats(self) -> Optional['dc.DBPoolStats']:
+        return self.__engine and self._pool_stats(self.__engine.pool)
+
+    @property
+    def async_pool_stats(self) -> Optional['dc.DBPoolStats']:
+        return self.__async_engine and self._pool_stats(self.__async_engine.pool)
+
+    def log_pool_stats(self):
+        if self.__engine is not None:
+            self.logger.info(f'Pool stats: {self.pool_stats}')
+        if self.__async_engine is not None:
+            self.logger.info(f'Async pool stats: {self.async_pool_stats}')
+
+    def make_sc(self, read_only: bool = False) -> SessionContext:
         while self.engine is None:
             sleep(.05)
+        if read_only:
+            return SessionContext(self.next_read_engine(), read_only)
         return SessionContext(self.__engine)
 
-    def with_sc(self) -> WithSessionContextManager:
-        return WithSessionContextManager(self)
+    def with_sc(self, read_only: bool = False) -> WithSessionContextManager:
+        return WithSessionContextManager(self, read_only)
+
+    def make_async_sc(self, read_only: bool = False) -> AsyncSessionContext:
+        if read_only:
+            return AsyncSessionContext(self.async_read_only_engine, read_only)
+        return AsyncSessionContext(self.async_engine)
+
+    def with_async_sc(self, read_only: bool = False) -> AsyncWithSessionContextManager:
+        return AsyncWithSessionContextManager(self, read_only)
+
+    async def async_stop(self):
+        if self.__async_engine is not None:
+            await self.__async_engine.dispose()
+        self.stop()
 
     def stop(self):
+        for replica in self.__replicas or []:
+            replica.stop()
+            replica.engine.dispose()
         if self.__engine is not None:
             self.__engine.dispose()
         self.logger.debug('DBController stopped.')
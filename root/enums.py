@@ -13,7 +13,9 @@ class UrlName(Enum):
     ADSPOT_STATS_ID = 'adspot_stats_id'
     TIMESLOTS = 'timeslots'
     TIMESLOTS_DATE = 'timeslots_date'
+    TIMESLOTS_DATE_RANGE = 'timeslots_date_range'
     PLAYBACKS = 'playbacks'
+    PLAYBACKS_BULK = 'playbacks_bulk'
     PLAYBACK_ID = 'playback_id'
     PLAYBACK = 'playback'
     CREATIVES = 'creatives'
@@ -22,6 +24,7 @@ class UrlName(Enum):
     CREATIVE_ID_REF = 'creative_id_ref'
     TIMESLOTS_BY_ADSPOT_ID = 'timeslots_by_adspot_id'
     TIMESLOTS_BY_ADSPOT_ID_DATE = 'timeslots_by_adspot_id_date'
+    TIMESLOTS_BY_ADSPOT_ID_DATE_RANGE = 'timeslots_by_adspot_id_date_range'
 
 
 class PlaybackStatus(Enum):
@@ -0,0 +1,87 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import root.data_classes as dc
+import root.exceptions as exceptions
+
+
+class MSExecutor:
+    """
+    Bounded thread pool for blocking `MS` calls.
+    Sized to the SQLAlchemy pool, so every worker can hold a connection
+    without waiting on the pool checkout.
+    """
+
+    def __init__(self, max_workers: int, timeout: Optional[float] = None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.timeouts = 0
+        self.__active = 0
+        self.__queued = 0
+        self.__lock = threading.Lock()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def for_db_config(
+            cls,
+            db_config: 'dc.DBConfig',
+            max_workers: Optional[int] = None,
+            timeout: Optional[float] = None,
+    ) -> 'MSExecutor':
+        pool_capacity = db_config.pool_size + db_config.max_overflow
+        return cls(min(max_workers or pool_capacity, pool_capacity), timeout)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='MSExecutor')
+        return self.__executor
+
+    @property
+    def stats(self) -> 'dc.ExecutorStats':
+        return dc.ExecutorStats(
+            self.max_workers,
+            self.__active,
+            self.__queued,
+            self.timeouts,
+        )
+
+    def __run_counted(self, fn: Callable[[], Any], started: threading.Event) -> Any:
+        started.set()
+        with self.__lock:
+            self.__queued -= 1
+            self.__active += 1
+        try:
+            return fn()
+        finally:
+            with self.__lock:
+                self.__active -= 1
+
+    async def run(self, fn: Callable[[], Any]) -> Any:
+        """
+        Run `fn` in the pool with the caller's context variables.
+        Work still queued after `timeout` is cancelled; work already started is awaited,
+        since it keeps using the caller's session until it returns.
+        """
+        ctx = contextvars.copy_context()
+        started = threading.Event()
+        with self.__lock:
+            self.__queued += 1
+        future = self.executor.submit(ctx.run, self.__run_counted, fn, started)
+        result = asyncio.wrap_future(future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(result), self.timeout)
+        except asyncio.TimeoutError:
+            if not started.is_set() and future.cancel():
+                self.timeouts += 1
+                with self.__lock:
+                    self.__queued -= 1
+                raise exceptions.APIError('Database is busy, please try again later', 503)
+        return await result
+
+    def stop(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+
+class GroupCommit:
+    """
+    Groups items submitted within `window` seconds of the first one, up to `max_size`,
+    and writes each group with a single `flush(items)` call.
+    `submit` returns the result of its group flush and raises the error of the flush if it failed.
+    Groups are flushed concurrently: a group starts filling while the previous one is written.
+    """
+
+    def __init__(
+            self,
+            flush: Callable[[list[Any]], Awaitable[Any]],
+            window: float,
+            max_size: int,
+    ):
+        self.flush = flush
+        self.window = window
+        self.max_size = max_size
+        self.flushes = 0
+        self.flushed = 0
+        self.__group: Optional[tuple[list[Any], list[asyncio.Future], asyncio.Event]] = None
+        self.__flushing: set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        if self.__group is None:
+            self.__group = ([], [], asyncio.Event())
+            task = asyncio.create_task(self.__flush_group(self.__group))
+            self.__flushing.add(task)
+            task.add_done_callback(self.__flushing.discard)
+        items, futures, full = self.__group
+        items.append(item)
+        futures.append(future)
+        if len(items) >= self.max_size:
+            self.__group = None
+            full.set()
+        # A cancelled submitter leaves its item in the group
+        return await asyncio.shield(future)
+
+    async def __flush_group(self, group: tuple[list[Any], list[asyncio.Future], asyncio.Event]):
+        items, futures, full = group
+        try:
+            await asyncio.wait_for(full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        if self.__group is group:
+            self.__group = None
+        try:
+            result = await self.flush(items)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+                    # Retrieved by the submitter unless it was cancelled
+                    future.exception()
+            return
+        self.flushes += 1
+        self.flushed += len(items)
+        for future in futures:
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Wait for the groups being filled or flushed."""
+        while self.__flushing:
+            await asyncio.gather(*self.__flushing, return_exceptions=True)
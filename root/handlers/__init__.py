@@ -3,7 +3,7 @@ from .adspots import AdSpotsHandler, AdSpotStreamHandler
 from .adspot_types import AdSpotTypesHandler
 from .timeslot import TimeSlotsHandler
 from .timeslot_date import TimeSlotsDateHandler
-from .playbacks import PlaybacksHandler
+from .playbacks import PlaybacksHandler, PlaybacksBulkHandler
 from .playback_statuses import PlaybackStatusesHandler
 from .creatives import CreativesHandler
 from .adspot_stats_id import AdSpotStatsIdHandler
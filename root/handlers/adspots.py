@@ -7,15 +7,20 @@ from root.handlers import BaseHandler, non_authorized
 class AdSpotsHandler(BaseHandler):
     async def get(self, id_: Optional[str] = None):
         if id_ is not None:
-            await self.send_json(self.ms.get_adspot(int(id_)))
+            await self.send_cached_json(lambda: self.ams.get_adspot(int(id_)))
         else:
-            await self.send_json(self.ms.get_adspots())
+            await self.send_cached_json(lambda: self.ams.get_adspots(
+                None,
+                self.get_bool_arg('active'),
+                self.get_int_arg('spot_type_id'),
+                **self.get_page_args(),
+            ))
 
 
 @non_authorized
 class AdSpotStreamHandler(BaseHandler):
     async def get(self, id_: str):
-        stream = self.ms.get_adspot_stream(int(id_))
+        stream = await self.ams.get_adspot_stream(int(id_))
         if stream:
             await self.send_json(stream)
         else:
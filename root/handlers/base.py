@@ -1,21 +1,23 @@
 import sys
 from contextlib import suppress
 from datetime import datetime
-from typing import Optional, Awaitable
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
 
-from deeply import Deeply
 import sqlalchemy.exc as sa_exc
 from sqlalchemy.orm import Session
 from tornado import escape
 from tornado.template import Loader
 from tornado.web import RequestHandler
 from tornado.escape import json_decode
+from tornado.ioloop import IOLoop
 
-from web3_token import Web3Token
 from root import Context
+import root.auth as auth
 import root.db_controller as db_controller
 import root.main_section as main_section
+import root.serializer as serializer
 import root.utils as utils
+from root.response_cache import ResponseCache
 import root.data_classes as dc
 import root.exceptions as exceptions
 from root.log_lib import get_logger
@@ -27,8 +29,13 @@ logger = get_logger(__name__)
 class BaseHandler(RequestHandler):
     __sc: 'db_controller.SessionContext' = None
     __sc_cm: 'db_controller.WithSessionContextManager' = None
+    __asc: 'db_controller.AsyncSessionContext' = None
+    __asc_cm: 'db_controller.AsyncWithSessionContextManager' = None
     __ms: 'main_section.MS' = None
+    __ams: 'main_section.AsyncMS' = None
     json_args: dict = None
+    user: 'dc.UserWeb' = None
+    auth_required: bool = True
     template_loader: Loader = None
     context: 'Context' = None
 
@@ -47,11 +54,38 @@ class BaseHandler(RequestHandler):
     def check_auth(self):
         assert self.current_user
 
-    def prepare(self):
+    async def prepare(self):
         self._prepare_json_args()
         self.context = self.settings['context']
+        if self.auth_required:
+            self.current_user = await self.get_current_user_async()
+            self.user = await self.authorize(self.current_user)
         self.check_auth()
 
+    async def authorize(self, request_user: 'dc.RequestUser') -> 'dc.UserWeb':
+        """
+        The advertiser of `request_user`, registered on the first request.
+        Written in its own short transaction on the primary,
+        before the request one which may be READ ONLY.
+        """
+        user: Optional['dc.UserWeb'] = self.context.identity_cache.get(request_user.meta_mask)
+        if user is not None and user.wallet_ref == request_user.near:
+            return user
+
+        def authorize() -> 'dc.UserWeb':
+            with self.context.sc as sc:
+                user_ = main_section.MS(sc.session, self.context).authorize(
+                    request_user.meta_mask,
+                    request_user.near,
+                )
+                sc.commit()
+            self.context.identity_cache.set(request_user.meta_mask, user_)
+            return user_
+
+        if self.context.executor is not None:
+            return await self.context.executor.run(authorize)
+        return authorize()
+
     def _request_summary(self) -> str:
         return "%s [%s] %s " % (
             self.request.method,
@@ -63,21 +97,32 @@ class BaseHandler(RequestHandler):
         token: str = self.request.headers.get('Authorization')
         if token:
             with suppress(Exception):
-                wt = Web3Token(token)
-                signer = wt.get_signer(validate=True)
-                token_data = wt.get_data()
-                session_exp = utils.proper_utc_date(token_data['Expiration Time'])
+                verified = auth.get_verified_token(token, self.context.token_cache)
+                return self._request_user(verified)
 
-                if session_exp < datetime.utcnow():
-                    raise exceptions.UnauthorizedError(
-                        'Your session has expired'
-                    )
+        raise exceptions.UnauthorizedError()
 
-                user = dc.RequestUser(wt.statement, signer)
-                return user
+    async def get_current_user_async(self) -> 'dc.RequestUser':
+        token: str = self.request.headers.get('Authorization')
+        if token:
+            with suppress(Exception):
+                verified = await auth.get_verified_token_async(
+                    token,
+                    self.context.token_cache,
+                    self.settings.get('signer_pool'),
+                )
+                return self._request_user(verified)
 
         raise exceptions.UnauthorizedError()
 
+    @staticmethod
+    def _request_user(verified: 'dc.VerifiedToken') -> 'dc.RequestUser':
+        if verified.expires_at < datetime.utcnow():
+            raise exceptions.UnauthorizedError(
+                'Your session has expired'
+            )
+        return verified.request_user
+
     def _prepare_json_args(self):
         content_type = self.request.headers.get('Content-Type', '')
         if any((i in content_type for i in ('application/x-json', 'application/json'))):
@@ -91,20 +136,80 @@ class BaseHandler(RequestHandler):
                 elif len(v) > 1:
                     self.json_args[k] = [v[i].decode('utf-8') for i in range(len(v))]
 
+    def get_int_arg(self, name: str) -> Optional[int]:
+        value = self.json_args.get(name)
+        return None if value in (None, '') else int(value)
+
+    def get_bool_arg(self, name: str) -> Optional[bool]:
+        value = self.json_args.get(name)
+        if value in (None, ''):
+            return None
+        return value is True or str(value).lower() in ('true', '1')
+
+    def get_datetime_arg(self, name: str) -> Optional[datetime]:
+        value = self.json_args.get(name)
+        return utils.proper_utc_date(value) if value else None
+
+    def get_page_args(self) -> dict[str, Any]:
+        """
+        `limit` (`default_page_size` unless given, capped by `max_page_size`)
+        and `cursor` of keyset pagination.
+        """
+        limit = self.get_int_arg('limit')
+        if limit is None:
+            limit = self.context.default_page_size
+        elif limit < 1:
+            raise exceptions.APIError('Argument `limit` must be a positive integer')
+        return {
+            'limit': min(limit, self.context.max_page_size),
+            'cursor': self.json_args.get('cursor') or None,
+        }
+
     def on_finish(self):
         if self.__sc_cm is not None:
             self.__sc_cm.__exit__(None, None, None)
+        if self.__asc_cm is not None:
+            IOLoop.current().add_callback(self.__asc_cm.__aexit__, None, None, None)
 
     @property
     def ms(self) -> 'main_section.MS':
         if self.__ms is None:
-            self.__ms = main_section.MS(self.session, self.context, self.current_user)
+            self.__ms = main_section.MS(self.session, self.context, self.current_user, self.user)
         return self.__ms
 
+    @property
+    def ams(self) -> 'main_section.AsyncMS':
+        """
+        Awaitable `MS`. Uses the asyncpg driver when `db.async_driver` is enabled,
+        otherwise the blocking `MS` runs in the context executor.
+        """
+        if self.__ams is None:
+            if self.context.db_config.async_driver:
+                self.__ams = main_section.AsyncMS.from_async_session(
+                    self.asc.session, self.context, self.current_user, self.user
+                )
+            elif self.context.executor is not None:
+                self.__ams = main_section.AsyncMS.in_executor(self.ms, self.context.executor)
+            else:
+                self.__ams = main_section.AsyncMS.inline(self.ms)
+        return self.__ams
+
+    @property
+    def asc(self) -> 'db_controller.AsyncSessionContext':
+        if self.__asc is None:
+            self.__asc_cm = self.context.db_controller.with_async_sc(self.read_only)
+            self.__asc = self.__asc_cm.enter()
+        return self.__asc
+
+    @property
+    def read_only(self) -> bool:
+        """GET requests run in READ ONLY transactions without a final commit."""
+        return self.request.method == 'GET'
+
     @property
     def sc(self) -> 'db_controller.SessionContext':
         if self.__sc is None:
-            self.__sc_cm = self.context.db_controller.with_sc()
+            self.__sc_cm = self.context.db_controller.with_sc(self.read_only)
             self.__sc = self.__sc_cm.__enter__()
         return self.__sc
 
@@ -177,24 +282,68 @@ class BaseHandler(RequestHandler):
     async def send_failed(self, msg: str = 'failed', status: int = 400):
         await self.send_json({'msg': msg}, status)
 
+    async def close_session(self) -> None:
+        if self.__sc is not None:
+            if self.context.executor is not None:
+                await self.context.executor.run(self.__sc.close)
+            else:
+                self.__sc.close()
+        if self.__asc is not None:
+            await self.__asc.close()
+
     async def send_json(self, data, status: int = 200) -> None:
         if data is None:
             return await self.send_failed('Not found', 404)
-        self.set_header('Content-Type', 'application/json')
-        self.set_status(status)
-        if self.__sc is not None:
-            self.__sc.close()
         if isinstance(data, list):
             data = {'data': data}
-        try:
-            body = escape.json_encode(data)
-        except TypeError:
-            data = Deeply._Deeply__deep_dict(data, Deeply.rules)  # noqa
-            body = escape.json_encode(data)
+        await self.send_body(serializer.dumps(data), status)
+
+    async def send_body(self, body: bytes, status: int = 200) -> None:
+        self.set_header('Content-Type', 'application/json')
+        self.set_status(status)
+        await self.close_session()
         await self.finish(body)
 
+    async def send_json_stream(self, batches: AsyncIterator[list]) -> None:
+        """
+        Send `{"data": [...]}` incrementally, flushing a chunk per batch.
+        """
+        self.set_header('Content-Type', 'application/json')
+        self.write(b'{"data":[')
+        separator = b''
+        async for batch in batches:
+            self.write(separator + serializer.dumps_items(batch))
+            separator = b','
+            await self.flush()
+        self.write(b']}')
+        await self.close_session()
+        await self.finish()
+
+    async def send_cached_json(self, get_data: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Send the response cached for this URI, building it with `get_data` on a miss.
+        `If-None-Match` requests matching the cached ETag get 304.
+        """
+        cache: 'ResponseCache' = self.context.response_cache
+        cached: Optional['dc.CachedResponse'] = cache.get(self.request.uri)
+        if cached is None:
+            data = await get_data()
+            if data is None:
+                return await self.send_failed('Not found', 404)
+            if isinstance(data, list):
+                data = {'data': data}
+            cached = cache.make_response(serializer.dumps(data))
+            cache.set(self.request.uri, cached)
+        self.set_header('Etag', cached.etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            await self.close_session()
+            return await self.finish()
+        await self.send_body(cached.body)
+
 
 def non_authorized(cls):
+    cls.auth_required = False
     cls.check_auth = lambda _: ...
     cls.get_current_user = lambda _: ...
     return cls
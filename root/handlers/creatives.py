@@ -9,13 +9,13 @@ class CreativesHandler(BaseHandler):
     async def get(self, id_: Optional[str] = None):
         mint = bool(self.json_args.get('mint') == 'true')
         if id_ is not None:
-            await self.send_json(self.ms.get_creative(int(id_)))
+            await self.send_json(await self.ams.get_creative(int(id_)))
         else:
-            await self.send_json(self.ms.get_creatives(None, mint))
+            await self.send_json(await self.ams.get_creatives(None, mint, **self.get_page_args()))
 
     async def post(self):
         try:
-            await self.ms.add_creative(
+            await self.ams.add_creative(
                 self.json_args['name'],
                 self.json_args['file'],
                 self.json_args['filename'],
@@ -24,15 +24,15 @@ class CreativesHandler(BaseHandler):
         except exc.APIError as e:
             await self.send_failed(e.message)
         else:
-            await self.send_json(self.ms.get_creatives())
+            await self.send_json(await self.ams.get_creatives())
 
     async def delete(self, id_):
-        self.ms.delete_creative(id_)
+        await self.ams.delete_creative(id_)
         await self.send_ok()
 
     async def put(self, id_):
         try:
-            self.ms.edit_creative(id_, self.json_args['blockchain_ref'])
+            await self.ams.edit_creative(id_, self.json_args['blockchain_ref'])
         except exc.APIError as e:
             await self.send_failed(e.message)
         else:
@@ -8,9 +8,25 @@ import root.exceptions as exc
 class PlaybacksHandler(BaseHandler):
     async def get(self, id_: Optional[str] = None):
         if id_ is not None:
-            await self.send_json(self.ms.get_playback(int(id_)))
+            await self.send_json(await self.ams.get_playback(int(id_)))
+        elif self.get_bool_arg('stream'):
+            await self.send_json_stream(self.ams.stream(
+                'stream_playbacks',
+                self.get_int_arg('adspot_id'),
+                self.json_args.get('status'),
+                self.get_datetime_arg('date_from'),
+                self.get_datetime_arg('date_to'),
+                self.context.stream_batch_size,
+            ))
         else:
-            await self.send_json(self.ms.get_playbacks())
+            await self.send_json(await self.ams.get_playbacks(
+                None,
+                self.get_int_arg('adspot_id'),
+                self.json_args.get('status'),
+                self.get_datetime_arg('date_from'),
+                self.get_datetime_arg('date_to'),
+                **self.get_page_args(),
+            ))
 
     async def post(self):
         timeslot = models.TimeSlot(
@@ -27,17 +43,17 @@ class PlaybacksHandler(BaseHandler):
             None,
         )
         try:
-            await self.send_json(self.ms.add_playback_timeslot(timeslot, creative))
+            await self.send_json(await self.ams.add_playback_timeslot(timeslot, creative))
         except exc.APIError as e:
             await self.send_failed(e.message, e.code)
 
     async def delete(self, id_: str):
-        self.ms.delete_playback(int(id_))
+        await self.ams.delete_playback(int(id_))
         await self.send_ok()
 
     async def put(self, id_):
         try:
-            self.ms.edit_playback(
+            await self.ams.edit_playback(
                 id_,
                 self.json_args['status'],
                 self.json_args['smart_contract'],
@@ -46,3 +62,15 @@ class PlaybacksHandler(BaseHandler):
             await self.send_failed(e.message)
         else:
             await self.send_ok()
+
+
+class PlaybacksBulkHandler(BaseHandler):
+    async def post(self):
+        items = self.json_args['playbacks']
+        if not isinstance(items, list) or not items:
+            return await self.send_failed('`playbacks` must be a non-empty list')
+        if len(items) > self.context.max_bulk_booking_size:
+            return await self.send_failed(
+                f'At most {self.context.max_bulk_booking_size} playbacks can be booked at once'
+            )
+        await self.send_json(await self.ams.add_playbacks_timeslots(items))
@@ -4,7 +4,20 @@ from root.handlers import BaseHandler
 
 class TimeSlotsHandler(BaseHandler):
     async def get(self):
-        await self.send_json(self.ms.get_timeslots())
+        if self.get_bool_arg('stream'):
+            return await self.send_json_stream(self.ams.stream(
+                'stream_timeslots',
+                self.get_int_arg('adspot_id'),
+                self.get_datetime_arg('date_from'),
+                self.get_datetime_arg('date_to'),
+                self.context.stream_batch_size,
+            ))
+        await self.send_json(await self.ams.get_timeslots(
+            self.get_int_arg('adspot_id'),
+            self.get_datetime_arg('date_from'),
+            self.get_datetime_arg('date_to'),
+            **self.get_page_args(),
+        ))
 
     # async def post(self):
     #     # if self.json_args['from_time'].second != 0 or self.json_args['to_time'].second != 0:
@@ -1,7 +1,9 @@
+from typing import Optional
+
 from root.handlers import BaseHandler
 
 
 class TimeSlotsDateHandler(BaseHandler):
 
-    async def get(self, date_):
-        await self.send_json(self.ms.get_timeslots_by_date(date_))
+    async def get(self, date_, date_to: Optional[str] = None):
+        await self.send_json(await self.ams.get_timeslots_by_date(date_, date_to))
@@ -3,14 +3,25 @@ from typing import Optional
 
 from root.handlers import BaseHandler
 
+AVAILABILITY_MEDIA_TYPE = 'application/vnd.meta-add.availability+json'
+
 
 class TimeslotsByAdspotId(BaseHandler):
-    async def get(self, id_: str, date_: Optional[str] = None):
+    @property
+    def compact(self) -> bool:
+        """`?format=compact` or the availability media type in `Accept` selects `dc.Availability`."""
+        return self.json_args.get('format') == 'compact' \
+            or AVAILABILITY_MEDIA_TYPE in self.request.headers.get('Accept', '')
+
+    async def get(self, id_: str, date_: Optional[str] = None, date_to: Optional[str] = None):
         if date_ is not None:
-            await self.send_json(
-                self.ms.get_timeslots_by_adspot_id(int(id_), date.fromisoformat(date_))
-            )
+            self.set_header('Vary', 'Accept')
+            args = (int(id_), date.fromisoformat(date_), date_to and date.fromisoformat(date_to))
+            if self.compact:
+                await self.send_json(await self.ams.get_availability_by_adspot_id(*args))
+            else:
+                await self.send_json(await self.ams.get_timeslots_by_adspot_id(*args))
         else:
             await self.send_json(
-                self.ms.get_timeslots_by_adspot_id(int(id_))
+                await self.ams.get_timeslots_by_adspot_id(int(id_))
             )
@@ -1,23 +1,35 @@
+import asyncio
 import base64
+import dataclasses
 import datetime
 import json
 import os
-from typing import Optional, Union
+from operator import attrgetter
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, Union
 
 import aiofiles
 import aiohttp
 from aiohttp.web import HTTPException
-from sqlalchemy import select, delete, update, Date, cast
+from sqlalchemy import select, delete, update, cast
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import sqlalchemy as sa
 from logging import Logger
 import root
 import root.log_lib as log_lib
+import root.utils as utils
 import root.models as models
 import root.data_classes as dc
 import root.exceptions as exc
 from root import enums
+from root.executor import MSExecutor
+from root.slot_index import SlotIndex
+
+EXCLUSION_VIOLATION = '23P01'
+# Leases are compared on the database clock, shared by all the dispatchers
+DB_UTCNOW = sa.func.timezone('utc', sa.func.now())
 
 
 class MS:
@@ -49,12 +61,102 @@ class MS:
             self.__logger = root.log_lib.get_logger(self.__class__.__name__)
         return self.__logger
 
-    def get_adspots(self, ids: Optional[list[int]] = None) -> list['dc.AdSpot']:
+    @staticmethod
+    def _paginate(
+            q: 'sa.sql.Select',
+            keys: list[tuple['sa.sql.ColumnElement', bool]],
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+    ) -> 'sa.sql.Select':
+        """
+        Order `q` by the unique `keys` ((expression, descending) pairs) and,
+        with `limit`, fetch one page after `cursor` plus one probe row.
+        """
+        q = q.order_by(*(sa.desc(key) if desc else key for key, desc in keys))
+        if limit is None:
+            return q
+        q = q.add_columns(*(key.label(f'cursor_{i}') for i, (key, _) in enumerate(keys)))
+        if cursor is not None:
+            values = utils.decode_cursor(cursor)
+            if len(values) != len(keys):
+                raise exc.APIError('Invalid cursor')
+            values = [sa.literal(value, key.type) for value, (key, _) in zip(values, keys)]
+            q = q.filter(sa.or_(*(
+                sa.and_(
+                    *(key == value for (key, _), value in zip(keys[:i], values)),
+                    key < values[i] if desc else key > values[i],
+                ) for i, (key, desc) in enumerate(keys)
+            )))
+        return q.limit(limit + 1)
+
+    @staticmethod
+    def _page(
+            rows: list[Row],
+            keys: list[tuple['sa.sql.ColumnElement', bool]],
+            limit: Optional[int],
+            convert: Callable[[Row], Any],
+    ) -> Union[list, 'dc.Page']:
+        if limit is None:
+            return [convert(row) for row in rows]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]._mapping
+            next_cursor = utils.encode_cursor([last[f'cursor_{i}'] for i in range(len(keys))])
+        return dc.Page([convert(row) for row in rows], next_cursor)
+
+    @staticmethod
+    def _from_columns(cls: type) -> Callable[[Row], Any]:
+        """
+        Map a Core row, whose leading columns follow the field order of the
+        `cls` dataclass, straight into `cls`.
+        """
+        fields_count = len(dataclasses.fields(cls))
+        return lambda row: cls(*row[:fields_count])
+
+    def _stream(
+            self,
+            q: 'sa.sql.Select',
+            convert: Callable[[Row], Any],
+            batch_size: int,
+    ) -> Iterator[list]:
+        result = self.session.execute(
+            q.execution_options(stream_results=True, yield_per=batch_size)
+        )
+        try:
+            for rows in result.partitions(batch_size):
+                yield [convert(row) for row in rows]
+        finally:
+            result.close()
+
+    def get_adspots(
+            self,
+            ids: Optional[list[int]] = None,
+            active: Optional[bool] = None,
+            spot_type_id: Optional[int] = None,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+    ) -> Union[list['dc.AdSpot'], 'dc.Page']:
+        """Returns a `dc.Page` instead of a list when `limit` is set."""
         q = select(
-            models.AdSpot,
-            models.AdSpotType,
-            models.AdSpotsStats,
-            models.Publisher,
+            models.AdSpot.id,
+            models.AdSpot.name,
+            models.AdSpot.active,
+            models.AdSpot.description,
+            models.Publisher.name,
+            models.Publisher.wallet_ref,
+            models.AdSpotType.name,
+            models.AdSpot.price,
+            models.AdSpot.preview_url,
+            models.AdSpot.preview_thumb_url,
+            models.AdSpot.jump_url,
+            models.AdSpot.spot_metadata,
+            models.AdSpotsStats.likes,
+            models.AdSpotsStats.views_amount,
+            models.AdSpotsStats.average_time,
+            models.AdSpotsStats.max_traffic,
+        ).select_from(
+            models.AdSpot
         ).outerjoin(
             models.AdSpotType,
             models.AdSpot.spot_type_id == models.AdSpotType.id,
@@ -64,33 +166,22 @@ class MS:
         ).outerjoin(
             models.Publisher,
             models.AdSpot.publisher_id == models.Publisher.id
-        ).order_by(
-            sa.desc(models.AdSpot.active),
-            models.AdSpot.spot_type_id
         )
         if ids is not None:
             q = q.filter(models.AdSpot.id.in_(ids))
-        rows: list[Union['models.AdSpot', models.AdSpotType]] = self.session.execute(q).all()
-        return [
-            dc.AdSpot(
-                row.AdSpot.id,
-                row.AdSpot.name,
-                row.AdSpot.active,
-                row.AdSpot.description,
-                row.Publisher.name,
-                row.Publisher.wallet_ref,
-                row.AdSpotType.name,
-                row.AdSpot.price,
-                row.AdSpot.preview_url,
-                row.AdSpot.preview_thumb_url,
-                row.AdSpot.jump_url,
-                row.AdSpot.spot_metadata,
-                row.AdSpotsStats and row.AdSpotsStats.likes,
-                row.AdSpotsStats and row.AdSpotsStats.views_amount,
-                row.AdSpotsStats and row.AdSpotsStats.average_time,
-                row.AdSpotsStats and row.AdSpotsStats.max_traffic,
-            ) for row in rows
+        if active is not None:
+            q = q.filter(models.AdSpot.active.is_(active))
+        if spot_type_id is not None:
+            q = q.filter(models.AdSpot.spot_type_id == spot_type_id)
+        keys = [
+            # Keyset values must not be NULL to compare
+            (sa.func.coalesce(models.AdSpot.active, True), True),
+            (sa.func.coalesce(models.AdSpot.spot_type_id, 2 ** 31 - 1), False),
+            (models.AdSpot.id, False),
         ]
+        q = self._paginate(q, keys, limit, cursor)
+        rows: list[Row] = self.session.execute(q).all()
+        return self._page(rows, keys, limit, self._from_columns(dc.AdSpot))
 
     def get_adspot(self, id_: int) -> 'dc.AdSpot':
         adspots = self.get_adspots([id_])
@@ -133,7 +224,14 @@ class MS:
             'ok',
         )
 
-    def get_creatives(self, ids: Optional[list[int]] = None, mint: bool = False) -> list['dc.Creative']:
+    def get_creatives(
+            self,
+            ids: Optional[list[int]] = None,
+            mint: bool = False,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+    ) -> Union[list['dc.Creative'], 'dc.Page']:
+        """Returns a `dc.Page` instead of a list when `limit` is set."""
         q = select(
             models.Creative,
         )
@@ -143,18 +241,18 @@ class MS:
             q = q.filter(models.Creative.id.in_(ids))
         if self.user:
             q = q.filter(models.Creative.advert_id == self.user.id)
+        keys = [(models.Creative.id, False)]
+        q = self._paginate(q, keys, limit, cursor)
 
         rows: list['models.Creative'] = self.session.execute(q).all()
-        return [
-            dc.Creative(
-                row.Creative.id,
-                row.Creative.nft_ref,
-                row.Creative.url,
-                row.Creative.name,
-                row.Creative.description,
-                row.Creative.blockchain_ref,
-            ) for row in rows
-        ]
+        return self._page(rows, keys, limit, lambda row: dc.Creative(
+            row.Creative.id,
+            row.Creative.nft_ref,
+            row.Creative.url,
+            row.Creative.name,
+            row.Creative.description,
+            row.Creative.blockchain_ref,
+        ))
 
     def get_creative(self, id_: int) -> 'dc.Creative':
         creatives = self.get_creatives([id_])
@@ -182,7 +280,15 @@ class MS:
             filename: str,
             description: str,
     ):
-        advert_id = self.user.id
+        uploaded = await self.upload_creative(file, filename)
+        if uploaded is not None:
+            self.save_creative(name, description, *uploaded)
+
+    async def upload_creative(self, file: str, filename: str) -> Optional[tuple[str, str, str]]:
+        """
+        Store the creative file locally and in NFT storage.
+        Returns (nft_ref, url, filepath) or None if upload failed.
+        """
         filename = f'{datetime.datetime.utcnow().timestamp()}_{filename}'
         filepath = os.path.join(self.context.static_path, filename)
         with open(filepath, 'wb') as f:
@@ -198,18 +304,21 @@ class MS:
         except exc.APIError as e:
             exc.APIError(e.message)
         else:
-            creative = models.Creative(
-                advert_id,
-                None,  # TODO: remove useless field
-                nft_ref,
-                None,
-                name,
-                description,
-                url,
-                filepath,
-            )
-            self.session.add(creative)
-            self.session.commit()
+            return nft_ref, url, filepath
+
+    def save_creative(self, name: str, description: str, nft_ref: str, url: str, filepath: str):
+        creative = models.Creative(
+            self.user.id,
+            None,  # TODO: remove useless field
+            nft_ref,
+            None,
+            name,
+            description,
+            url,
+            filepath,
+        )
+        self.session.add(creative)
+        self.session.commit()
 
     def delete_creative(self, id_):
         _id = int(id_)
@@ -276,20 +385,37 @@ class MS:
             raise exc.APIError(f'Playback id = {_id} not found or no rights to edit this id.')
         self.session.commit()
 
-    def get_playbacks(self, ids: Optional[list[int]] = None) -> list['dc.Playback']:
+    def _playbacks_query(
+            self,
+            ids: Optional[list[int]] = None,
+            adspot_id: Optional[int] = None,
+            status: Optional[str] = None,
+            date_from: Optional[datetime.datetime] = None,
+            date_to: Optional[datetime.datetime] = None,
+    ) -> 'sa.sql.Select':
         q = select(
-            models.Playback,
-            models.Creative,
-            models.CreativeType,
-            models.TimeSlot,
-            models.AdSpot,
-            models.AdSpotType
+            models.Playback.id,
+            models.AdSpot.name,
+            models.TimeSlot.from_time,
+            models.TimeSlot.to_time,
+            models.Creative.advert_id,
+            models.Creative.name,
+            models.Creative.description,
+            models.Creative.url,
+            models.Creative.path,
+            # Enum labels equal their values
+            cast(models.Playback.status, sa.String),
+            models.Playback.smart_contract,
+            models.AdSpot.price,
+            models.TimeSlot.locked,
+            models.AdSpotType.name,
+            models.Playback.taken_at,
+            models.Playback.processed_at,
+        ).select_from(
+            models.Playback
         ).join(
             models.Creative,
             models.Playback.creative_id == models.Creative.id,
-        ).outerjoin(
-            models.CreativeType,
-            models.Creative.creative_type_id == models.CreativeType.id,
         ).join(
             models.Advertiser,
             models.Creative.advert_id == models.Advertiser.id,
@@ -307,74 +433,153 @@ class MS:
             q = q.filter(models.Playback.id.in_(ids))
         if self.user:
             q = q.filter(models.Advertiser.id == self.user.id)
+        if adspot_id is not None:
+            q = q.filter(models.Playback.adspot_id == adspot_id)
+        if status is not None:
+            q = q.filter(models.Playback.status == enums.PlaybackStatus(status.lower()))
+        if date_from is not None:
+            q = q.filter(models.TimeSlot.from_time >= date_from)
+        if date_to is not None:
+            q = q.filter(models.TimeSlot.from_time < date_to)
+        return q
 
-        rows: list['models.Playback'] = self.session.execute(q).all()
-        return [
-            dc.Playback(
-                row.Playback.id,
-                row.AdSpot.name,
-                row.TimeSlot.from_time,
-                row.TimeSlot.to_time,
-                row.Creative.advert_id,
-                row.Creative.name,
-                row.Creative.description,
-                row.Creative.url,
-                row.Creative.path,
-                row.Playback.status and row.Playback.status.value,
-                row.Playback.smart_contract,
-                row.AdSpot.price,
-                row.TimeSlot.locked,
-                row.AdSpotType.name,
-                row.Playback.taken_at,
-                row.Playback.processed_at,
-            ) for row in rows
-        ]
+    def get_playbacks(
+            self,
+            ids: Optional[list[int]] = None,
+            adspot_id: Optional[int] = None,
+            status: Optional[str] = None,
+            date_from: Optional[datetime.datetime] = None,
+            date_to: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+    ) -> Union[list['dc.Playback'], 'dc.Page']:
+        """
+        Playbacks with time slots starting within [date_from, date_to).
+        Returns a `dc.Page` instead of a list when `limit` is set.
+        """
+        q = self._playbacks_query(ids, adspot_id, status, date_from, date_to)
+        keys = [(models.Playback.id, False)]
+        q = self._paginate(q, keys, limit, cursor)
+
+        rows: list[Row] = self.session.execute(q).all()
+        return self._page(rows, keys, limit, self._from_columns(dc.Playback))
+
+    def stream_playbacks(
+            self,
+            adspot_id: Optional[int] = None,
+            status: Optional[str] = None,
+            date_from: Optional[datetime.datetime] = None,
+            date_to: Optional[datetime.datetime] = None,
+            batch_size: int = 1000,
+    ) -> Iterator[list['dc.Playback']]:
+        """Same as `get_playbacks`, in batches read from a server-side cursor."""
+        q = self._playbacks_query(None, adspot_id, status, date_from, date_to)
+        return self._stream(q.order_by(models.Playback.id), self._from_columns(dc.Playback), batch_size)
 
     def get_playback(self, id_: int) -> 'dc.Playback':
         playbacks = self.get_playbacks([id_])
         return playbacks[0] if playbacks else None
 
-    def allocate_pending_playbacks(self) -> list['dc.AdTask']:
-        from_dt = datetime.datetime.utcnow()
-        to_dt = from_dt + datetime.timedelta(seconds=15)
-        rows: list['models.Playback'] = self.session.execute(
-            select(
-                models.Playback.id,
-                models.Playback.taken_at,
-                models.Playback.adspot_id,
-                models.Creative.path,
-                models.TimeSlot.from_time,
-                models.TimeSlot.to_time,
-                models.AdSpot.publish_url,
-                models.AdSpot.stop_url,
-                models.AdSpot.delay_before_publish,
-            ).select_from(
-                models.Playback
-            ).join(
-                models.Creative,
-                models.Playback.creative_id == models.Creative.id,
-            ).join(
-                models.TimeSlot,
-                models.Playback.timeslot_id == models.TimeSlot.id,
-            ).join(
-                models.AdSpot,
-                models.Playback.adspot_id == models.AdSpot.id,
-            ).filter(
-                models.Playback.smart_contract.isnot(None),
+    def allocate_pending_playbacks(
+            self,
+            from_dt: Optional[datetime.datetime] = None,
+            to_dt: Optional[datetime.datetime] = None,
+            adspot_ids: Optional[Iterable[int]] = None,
+            worker_id: Optional[str] = None,
+            lease_ttl: float = 30,
+            limit: Optional[int] = None,
+    ) -> list['dc.AdTask']:
+        """
+        Publish tasks of playbacks starting and stop tasks of playbacks ending
+        within [from_dt, to_dt], by default the next 15 seconds,
+        optionally of `adspot_ids` only.
+        With `worker_id` only tasks not leased by another worker are returned,
+        and they are leased to `worker_id` for `lease_ttl` seconds.
+        Rows locked by a concurrent claim are skipped, so each task goes to one worker.
+        `limit` caps the newly leased tasks to the earliest due ones,
+        leaving the others to the concurrent workers.
+        """
+        from_dt = from_dt or datetime.datetime.utcnow()
+        to_dt = to_dt or from_dt + datetime.timedelta(seconds=15)
+        q = select(
+            models.Playback.id,
+            models.Playback.taken_at,
+            models.Playback.adspot_id,
+            models.Creative.path,
+            models.TimeSlot.from_time,
+            models.TimeSlot.to_time,
+            models.AdSpot.publish_url,
+            models.AdSpot.stop_url,
+            models.AdSpot.delay_before_publish,
+        ).select_from(
+            models.Playback
+        ).join(
+            models.Creative,
+            models.Playback.creative_id == models.Creative.id,
+        ).join(
+            models.TimeSlot,
+            models.Playback.timeslot_id == models.TimeSlot.id,
+        ).join(
+            models.AdSpot,
+            models.Playback.adspot_id == models.AdSpot.id,
+        ).filter(
+            models.Playback.smart_contract.isnot(None),
+            sa.or_(
+                sa.and_(
+                    models.Playback.taken_at.is_(None),
+                    models.Playback.processed_at.is_(None),
+                    models.TimeSlot.from_time.between(from_dt, to_dt)
+                ),
+                sa.and_(
+                    models.Playback.taken_at.isnot(None),
+                    models.Playback.processed_at.is_(None),
+                    models.TimeSlot.to_time.between(from_dt, to_dt)
+                )
+            )
+        )
+        if adspot_ids is not None:
+            q = q.filter(models.Playback.adspot_id.in_(adspot_ids))
+        due_first = sa.case(
+            (models.Playback.taken_at.is_(None), models.TimeSlot.from_time),
+            else_=models.TimeSlot.to_time,
+        )
+        if worker_id is None:
+            rows: list[Row] = self.session.execute(
+                q if limit is None else q.order_by(due_first).limit(limit)
+            ).all()
+        else:
+            # Tasks already held, locked so they can't be taken over until the leases are renewed
+            rows = self.session.execute(
+                q.filter(
+                    models.Playback.leased_by == worker_id,
+                ).with_for_update(of=models.Playback)
+            ).all()
+            claim_q = q.filter(
                 sa.or_(
+                    models.Playback.leased_by.is_(None),
                     sa.and_(
-                        models.Playback.taken_at.is_(None),
-                        models.Playback.processed_at.is_(None),
-                        models.TimeSlot.from_time.between(from_dt, to_dt)
+                        models.Playback.leased_by != worker_id,
+                        models.Playback.leased_until < DB_UTCNOW,
                     ),
-                    sa.and_(
-                        models.Playback.taken_at.isnot(None),
-                        models.Playback.processed_at.is_(None),
-                        models.TimeSlot.to_time.between(from_dt, to_dt)
+                )
+            ).with_for_update(of=models.Playback, skip_locked=True)
+            if limit is not None:
+                claim_q = claim_q.order_by(due_first).limit(limit)
+            rows += self.session.execute(claim_q).all()
+            if rows:
+                self.session.execute(
+                    update(
+                        models.Playback
+                    ).where(
+                        models.Playback.id.in_([row.id for row in rows])
+                    ).values(
+                        leased_by=worker_id,
+                        leased_until=DB_UTCNOW + datetime.timedelta(seconds=lease_ttl),
+                        heartbeat_at=DB_UTCNOW,
+                    ).execution_options(
+                        synchronize_session=False
                     )
                 )
-            )
-        ).all()
 
         def get_call_time(task_row):
             if task_row.taken_at is None:
@@ -412,23 +617,76 @@ class MS:
             )
         return tasks
 
-    def mark_task_complete(self, task: 'dc.AdTask'):
-        state_at = datetime.datetime.utcnow()
-        if task.primarily:
-            state = {models.Playback.taken_at.key: state_at}
-        else:
-            state = {models.Playback.processed_at.key: state_at}
-        self.session.execute(
+    def mark_tasks_complete(self, tasks: list['dc.AdTask'], worker_id: str) -> list[int]:
+        """
+        Mark publish/stop `tasks` leased by `worker_id` done and release their leases,
+        in a single `UPDATE ... FROM (VALUES ...)`.
+        Returns ids of the playbacks marked, tasks whose lease was lost are left as is.
+        """
+        if not tasks:
+            return []
+        done: dict[int, list[bool]] = {}
+        for task in tasks:
+            published_stopped = done.setdefault(task.playback_id, [False, False])
+            published_stopped[not task.primarily] = True
+        completed = sa.values(
+            sa.column('id', sa.Integer),
+            sa.column('published', sa.Boolean),
+            sa.column('stopped', sa.Boolean),
+            name='completed',
+        ).data(
+            [(playback_id, published, stopped) for playback_id, (published, stopped) in done.items()]
+        )
+        state_at = sa.literal(datetime.datetime.utcnow(), sa.DateTime)
+        return self.session.execute(
             update(
                 models.Playback
             ).where(
-                models.Playback.id == task.playback_id
+                models.Playback.id == completed.c.id,
+                models.Playback.leased_by == worker_id,
             ).values(
-                **state
+                taken_at=sa.case((completed.c.published, state_at), else_=models.Playback.taken_at),
+                processed_at=sa.case((completed.c.stopped, state_at), else_=models.Playback.processed_at),
+                leased_by=None,
+                leased_until=None,
+            ).returning(
+                models.Playback.id
             ).execution_options(
-                synchronize_session="evaluate"
+                synchronize_session=False
             )
-        )
+        ).scalars().all()
+
+    def renew_leases(self, worker_id: str, lease_ttl: float = 30) -> list[int]:
+        """Extend the leases of `worker_id`, returns ids of the playbacks it still holds."""
+        return self.session.execute(
+            update(
+                models.Playback
+            ).where(
+                models.Playback.leased_by == worker_id
+            ).values(
+                leased_until=DB_UTCNOW + datetime.timedelta(seconds=lease_ttl),
+                heartbeat_at=DB_UTCNOW,
+            ).returning(
+                models.Playback.id
+            ).execution_options(
+                synchronize_session=False
+            )
+        ).scalars().all()
+
+    def release_leases(self, worker_id: str) -> int:
+        """Hand the pending tasks of `worker_id` back to the other workers."""
+        return self.session.execute(
+            update(
+                models.Playback
+            ).where(
+                models.Playback.leased_by == worker_id
+            ).values(
+                leased_by=None,
+                leased_until=None,
+            ).execution_options(
+                synchronize_session=False
+            )
+        ).rowcount
 
     def get_adspot_stats(self, id_: int) -> 'dc.AdSpotStats':
         row: models.AdSpotsStats = self.session.execute(
@@ -446,11 +704,20 @@ class MS:
             row.AdSpotsStats.max_traffic,
         )
 
-    def get_timeslots_by_adspot_id(self, id_: int, date_: 'Optional[datetime]' = None) -> list['dc.TimeSlot']:
+    def _adspot_timeslots(
+            self,
+            id_: int,
+            day_from: Optional[datetime.datetime] = None,
+            day_to: Optional[datetime.datetime] = None,
+    ) -> list['dc.TimeSlot']:
         q = select(
-                models.Playback,
-                models.TimeSlot,
-                models.AdSpot,
+                models.TimeSlot.id,
+                models.TimeSlot.from_time,
+                models.TimeSlot.to_time,
+                models.TimeSlot.locked,
+                models.AdSpot.price,
+            ).select_from(
+                models.Playback
             ).join(
                 models.TimeSlot,
                 models.Playback.timeslot_id == models.TimeSlot.id,
@@ -460,61 +727,181 @@ class MS:
             ).filter(
                 models.AdSpot.id == id_,
             )
-        if date_ is not None:
-            q = q.filter(cast(models.TimeSlot.from_time, Date) == date_)
-        rows: list['models.TimeSlot'] = self.session.execute(q).all()
-        db_time_slots = [
-            dc.TimeSlot(
-                row.TimeSlot.id,
-                row.TimeSlot.from_time,
-                row.TimeSlot.to_time,
-                row.TimeSlot.locked,
-                row.AdSpot.price
-            ) for row in rows
+        if day_from is not None:
+            q = q.filter(
+                models.TimeSlot.from_time >= day_from,
+                models.TimeSlot.from_time < day_to,
+            )
+        rows: list[Row] = self.session.execute(q).all()
+        return list(map(self._from_columns(dc.TimeSlot), rows))
+
+    def _slot_index(self, from_time: datetime.datetime) -> Optional['SlotIndex']:
+        """The slot index, if it is loaded and answers for ranges starting at `from_time`."""
+        slot_index = self.context.slot_index
+        return slot_index if slot_index is not None and slot_index.covers(from_time) else None
+
+    def get_bookings(self, ending_after: Optional[datetime.datetime] = None) -> list['dc.Booking']:
+        q = select(
+            models.Playback.adspot_id,
+            models.Playback.id,
+            models.TimeSlot.id,
+            models.TimeSlot.from_time,
+            models.TimeSlot.to_time,
+            models.TimeSlot.locked,
+        ).join(
+            models.TimeSlot,
+            models.Playback.timeslot_id == models.TimeSlot.id,
+        )
+        if ending_after is not None:
+            q = q.filter(models.TimeSlot.to_time > ending_after)
+        rows: list[Row] = self.session.execute(q).all()
+        return list(map(self._from_columns(dc.Booking), rows))
+
+    def _booked_timeslots(
+            self,
+            id_: int,
+            day_from: datetime.datetime,
+            day_to: datetime.datetime,
+            price: float,
+    ) -> list['dc.TimeSlot']:
+        slot_index = self._slot_index(day_from)
+        if slot_index is None:
+            return self._adspot_timeslots(id_, day_from, day_to)
+        return [
+            dc.TimeSlot(booking.timeslot_id, booking.from_time, booking.to_time, booking.locked, price)
+            for booking in slot_index.bookings(id_, day_from, day_to)
         ]
-        if date_ is None:
-            return db_time_slots
 
-        adspot_price = self.session.query(
+    def _adspot_price(self, id_: int) -> float:
+        return self.session.query(
             models.AdSpot.price
         ).filter(
             models.AdSpot.id == id_
         ).first().price
 
+    def _day_range(
+            self,
+            date_: datetime.date,
+            date_to: Optional[datetime.date] = None,
+    ) -> tuple[datetime.datetime, datetime.datetime]:
+        """`utils.day_range` of a requested range, rejecting reversed and too long ones."""
+        if date_to is not None:
+            if date_to < date_:
+                raise exc.APIError('End date must not be before the start date')
+            if (date_to - date_).days >= self.context.max_date_range_days:
+                raise exc.APIError(f'Date range must not exceed {self.context.max_date_range_days} days')
+        return utils.day_range(date_, date_to)
+
+    def get_timeslots_by_adspot_id(
+            self,
+            id_: int,
+            date_: Optional[datetime.date] = None,
+            date_to: Optional[datetime.date] = None,
+    ) -> list['dc.TimeSlot']:
+        """
+        Booked time slots of an adspot.
+        With `date_` every minute of the days from `date_` to `date_to` (inclusive)
+        is returned, free minutes as unsaved slots priced at the adspot price.
+        """
+        if date_ is None:
+            return self._adspot_timeslots(id_)
+        day_from, day_to = self._day_range(date_, date_to)
+        price = self._adspot_price(id_)
+        db_time_slots = self._booked_timeslots(id_, day_from, day_to, price)
+        return self._minute_grid(db_time_slots, day_from, day_to, price)
+
+    def get_availability_by_adspot_id(
+            self,
+            id_: int,
+            date_: datetime.date,
+            date_to: Optional[datetime.date] = None,
+    ) -> 'dc.Availability':
+        """Compact form of the `get_timeslots_by_adspot_id` minute grid."""
+        day_from, day_to = self._day_range(date_, date_to)
+        price = self._adspot_price(id_)
+        db_time_slots = self._booked_timeslots(id_, day_from, day_to, price)
+        return dc.Availability(
+            date_,
+            date_to or date_,
+            60,
+            price,
+            self._minute_runs(db_time_slots, day_from, day_to),
+        )
+
+    @staticmethod
+    def _minute_grid(
+            booked: list['dc.TimeSlot'],
+            day_from: datetime.datetime,
+            day_to: datetime.datetime,
+            price: float,
+    ) -> list['dc.TimeSlot']:
+        """
+        One entry per minute of [day_from, day_to): the booked slot covering the minute,
+        else a free one-minute slot at `price`.
+        A single sweep over the bookings sorted by start, so linear in minutes plus bookings.
+        """
+        booked = sorted(booked, key=attrgetter('from_time'))
+        minute = datetime.timedelta(minutes=1)
         time_slots = []
-        for i in range(24 * 60):
-            dt = datetime.datetime.combine(date_, datetime.time(i // 60, i % 60))
-            locked_ts = next((ts for ts in db_time_slots if dt in ts), None)
-            if locked_ts:
-                time_slots.append(locked_ts)
+        i = 0
+        dt = day_from
+        while dt < day_to:
+            while i < len(booked) and booked[i].to_time <= dt:
+                i += 1
+            if i < len(booked) and booked[i].from_time <= dt:
+                time_slots.append(booked[i])
             else:
-                time_slots.append(dc.TimeSlot(
-                    None,
-                    dt,
-                    dt + datetime.timedelta(minutes=1),
-                    False,
-                    adspot_price
-                ))
+                time_slots.append(dc.TimeSlot(None, dt, dt + minute, False, price))
+            dt += minute
         return time_slots
 
-    def get_timeslots_by_date(self, date_: str) -> list['dc.TimeSlot']:
-        _date = datetime.datetime.fromisoformat(date_).date()
-        rows: list['models.TimeSlot'] = self.session.execute(
+    @staticmethod
+    def _minute_runs(
+            booked: list['dc.TimeSlot'],
+            day_from: datetime.datetime,
+            day_to: datetime.datetime,
+    ) -> list[int]:
+        """
+        Same occupancy as `_minute_grid` as alternating free/booked run lengths,
+        starting with a free run. A booking covers the minutes starting within it.
+        """
+        minute = datetime.timedelta(minutes=1)
+        minutes = (day_to - day_from) // minute
+        runs = []
+        position = 0
+        for ts in sorted(booked, key=attrgetter('from_time')):
+            start = max(-((day_from - ts.from_time) // minute), position)
+            end = min(-((day_from - ts.to_time) // minute), minutes)
+            if start >= end:
+                continue
+            if start == position and runs:
+                runs[-1] += end - position
+            else:
+                runs += [start - position, end - start]
+            position = end
+        if position < minutes:
+            runs.append(minutes - position)
+        return runs
+
+    def get_timeslots_by_date(self, date_: str, date_to: Optional[str] = None) -> list['dc.TimeSlot']:
+        """Time slots starting on the days from `date_` to `date_to` (inclusive)."""
+        day_from, day_to = self._day_range(
+            datetime.datetime.fromisoformat(date_).date(),
+            date_to and datetime.datetime.fromisoformat(date_to).date(),
+        )
+        rows: list[Row] = self.session.execute(
             select(
-                models.TimeSlot,
+                models.TimeSlot.id,
+                models.TimeSlot.from_time,
+                models.TimeSlot.to_time,
+                models.TimeSlot.locked,
+                sa.literal(0),
             ).filter(
-                cast(models.TimeSlot.from_time, Date) == _date,
+                models.TimeSlot.from_time >= day_from,
+                models.TimeSlot.from_time < day_to,
             )
         ).all()
-        return [
-            dc.TimeSlot(
-                row.TimeSlot.id,
-                row.TimeSlot.from_time,
-                row.TimeSlot.to_time,
-                row.TimeSlot.locked,
-                0
-            ) for row in rows
-        ]
+        return list(map(self._from_columns(dc.TimeSlot), rows))
 
     def add_playback(self, playback):
         self.session.add(playback)
@@ -539,7 +926,10 @@ class MS:
             ).where(
                 models.Playback.id == id_,
             )
-        self.session.execute(q)
+        deleted = self.session.execute(q.returning(models.Playback.id)).scalars().all()
+        if self.context.slot_index is not None:
+            for playback_id in deleted:
+                self.context.slot_index.remove(self.session, playback_id)
         self.session.commit()
 
     def get_adspot_types(self) -> list['dc.AdSpotTypes']:
@@ -555,35 +945,75 @@ class MS:
             ) for row in rows
         ]
 
-    def get_timeslots(self) -> list['dc.TimeSlot']:
-        rows: list['models.TimeSlot'] = self.session.execute(
-            select(
-                models.TimeSlot,
-                models.Playback,
-                models.AdSpot,
-            ).join(
-                models.Playback,
-                models.Playback.timeslot_id == models.TimeSlot.id,
-            ).join(
-                models.AdSpot,
-                models.Playback.adspot_id == models.AdSpot.id,
-            )
-        ).all()
-        return [
-            dc.TimeSlot(
-                row.TimeSlot.id,
-                row.TimeSlot.from_time,
-                row.TimeSlot.to_time,
-                row.TimeSlot.locked,
-                row.AdSpot.price
-            ) for row in rows
-        ]
+    @staticmethod
+    def _timeslots_query(
+            adspot_id: Optional[int] = None,
+            date_from: Optional[datetime.datetime] = None,
+            date_to: Optional[datetime.datetime] = None,
+    ) -> 'sa.sql.Select':
+        q = select(
+            models.TimeSlot.id,
+            models.TimeSlot.from_time,
+            models.TimeSlot.to_time,
+            models.TimeSlot.locked,
+            models.AdSpot.price,
+        ).select_from(
+            models.TimeSlot
+        ).join(
+            models.Playback,
+            models.Playback.timeslot_id == models.TimeSlot.id,
+        ).join(
+            models.AdSpot,
+            models.Playback.adspot_id == models.AdSpot.id,
+        )
+        if adspot_id is not None:
+            q = q.filter(models.Playback.adspot_id == adspot_id)
+        if date_from is not None:
+            q = q.filter(models.TimeSlot.from_time >= date_from)
+        if date_to is not None:
+            q = q.filter(models.TimeSlot.from_time < date_to)
+        return q
+
+    def get_timeslots(
+            self,
+            adspot_id: Optional[int] = None,
+            date_from: Optional[datetime.datetime] = None,
+            date_to: Optional[datetime.datetime] = None,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None,
+    ) -> Union[list['dc.TimeSlot'], 'dc.Page']:
+        """
+        Booked time slots starting within [date_from, date_to).
+        Returns a `dc.Page` instead of a list when `limit` is set.
+        """
+        q = self._timeslots_query(adspot_id, date_from, date_to)
+        keys = [(models.TimeSlot.id, False)]
+        q = self._paginate(q, keys, limit, cursor)
+
+        rows: list[Row] = self.session.execute(q).all()
+        return self._page(rows, keys, limit, self._from_columns(dc.TimeSlot))
+
+    def stream_timeslots(
+            self,
+            adspot_id: Optional[int] = None,
+            date_from: Optional[datetime.datetime] = None,
+            date_to: Optional[datetime.datetime] = None,
+            batch_size: int = 1000,
+    ) -> Iterator[list['dc.TimeSlot']]:
+        """Same as `get_timeslots`, in batches read from a server-side cursor."""
+        q = self._timeslots_query(adspot_id, date_from, date_to)
+        return self._stream(q.order_by(models.TimeSlot.id), self._from_columns(dc.TimeSlot), batch_size)
 
     def add_timeslot(self, timeslot):
         self.session.add(timeslot)
         self.session.commit()
         return timeslot.id
 
+    @staticmethod
+    def _is_booking_conflict(e: 'sa.exc.IntegrityError') -> bool:
+        """`playbacks_booked_during_excl` violation, psycopg2 and asyncpg errors both carry `pgcode`."""
+        return getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION
+
     def add_playback_timeslot(self, timeslot, playback):
         if (timeslot.to_time - timeslot.from_time).seconds > self.context.max_timeslot_duration:
             raise exc.APIError(f'APIError: period from_time-to_time is must be '
@@ -599,12 +1029,32 @@ class MS:
             raise exc.APIError(f'Current creative.id={playback.creative_id} is unavailable.')
         elif not creative.blockchain_ref:
             raise exc.APIError('Current creative.blockchain_ref is empty.')
+        slot_index = self._slot_index(timeslot.from_time)
+        if slot_index is not None \
+                and not slot_index.is_free(playback.adspot_id, timeslot.from_time, timeslot.to_time):
+            raise exc.APIError('Time slot is already booked', 409)
 
         self.session.add(timeslot)
         self.session.flush()
         if timeslot.id:
             playback.timeslot_id = timeslot.id
             self.session.add(playback)
+            try:
+                self.session.flush()
+            except sa.exc.IntegrityError as e:
+                self.session.rollback()
+                if self._is_booking_conflict(e):
+                    raise exc.APIError('Time slot is already booked', 409)
+                raise
+            if self.context.slot_index is not None:
+                self.context.slot_index.add(self.session, dc.Booking(
+                    playback.adspot_id,
+                    playback.id,
+                    timeslot.id,
+                    timeslot.from_time,
+                    timeslot.to_time,
+                    timeslot.locked,
+                ))
             self.session.commit()
             self.session.refresh(playback)
             return dc.PlaybackRaw(
@@ -619,6 +1069,168 @@ class MS:
         else:
             self.session.rollback()
 
+    @staticmethod
+    def _parse_booking(item: Any) -> dict[str, Any]:
+        """Fields of a bulk booking item, `APIError` names the first missing or invalid one."""
+        if not isinstance(item, dict):
+            raise exc.APIError('Booking must be an object')
+
+        def field(name: str, parse: Callable[[Any], Any], required: bool = True) -> Any:
+            value = item.get(name)
+            if value in (None, ''):
+                if required:
+                    raise exc.APIError(f'Argument `{name}` is required but not specified.')
+                return None
+            try:
+                return parse(value)
+            except (TypeError, ValueError, AttributeError):
+                raise exc.APIError(f'Argument `{name}` is invalid: {value!r}')
+
+        return dict(
+            adspot_id=field('adspot_id', int),
+            creative_id=field('creative_id', int),
+            from_time=field('from_time', utils.proper_utc_date),
+            to_time=field('to_time', utils.proper_utc_date),
+            status=field('status', lambda status: enums.PlaybackStatus(status.lower()), required=False),
+            smart_contract=item.get('smart_contract'),
+        )
+
+    def add_playbacks_timeslots(self, items: list[dict[str, Any]]) -> 'dc.BulkBooking':
+        """
+        Book many time slots in one transaction.
+        Malformed items, items with an unknown adspot, an invalid creative or period, or overlapping another
+        booking (or an earlier item), are reported in `conflicts`; the rest are booked.
+        """
+        conflicts: dict[int, str] = {}
+        bookings: list[Optional[dict[str, Any]]] = []
+        for i, item in enumerate(items):
+            try:
+                booking = self._parse_booking(item)
+            except exc.APIError as e:
+                bookings.append(None)
+                conflicts[i] = e.message
+                continue
+            bookings.append(booking)
+            from_time, to_time = booking['from_time'], booking['to_time']
+            if not from_time < to_time:
+                conflicts[i] = 'from_time must be earlier than to_time'
+            elif (to_time - from_time).total_seconds() > self.context.max_timeslot_duration:
+                conflicts[i] = f'period from_time-to_time is must be ' \
+                               f'smaller than {self.context.max_timeslot_duration} sec'
+
+        creatives = dict(self.session.execute(
+            select(
+                models.Creative.id,
+                models.Creative.blockchain_ref,
+            ).where(
+                models.Creative.id.in_({booking['creative_id'] for booking in bookings if booking is not None}),
+            )
+        ).all())
+        adspot_ids = set(self.session.execute(
+            select(
+                models.AdSpot.id,
+            ).where(
+                models.AdSpot.id.in_({booking['adspot_id'] for booking in bookings if booking is not None}),
+            )
+        ).scalars().all())
+        for i, booking in enumerate(bookings):
+            if i in conflicts:
+                continue
+            if booking['adspot_id'] not in adspot_ids:
+                conflicts[i] = f'Current adspot.id={booking["adspot_id"]} is unavailable.'
+            elif booking['creative_id'] not in creatives:
+                conflicts[i] = f'Current creative.id={booking["creative_id"]} is unavailable.'
+            elif not creatives[booking['creative_id']]:
+                conflicts[i] = 'Current creative.blockchain_ref is empty.'
+            elif (slot_index := self._slot_index(booking['from_time'])) is not None and not slot_index.is_free(
+                    booking['adspot_id'], booking['from_time'], booking['to_time']):
+                conflicts[i] = 'Time slot is already booked'
+
+        # Overlaps within the request: the earlier item wins
+        accepted = sorted(
+            (i for i in range(len(bookings)) if i not in conflicts),
+            key=lambda i: (bookings[i]['adspot_id'], bookings[i]['from_time']),
+        )
+        previous = None
+        for i in accepted:
+            if previous is not None \
+                    and bookings[previous]['adspot_id'] == bookings[i]['adspot_id'] \
+                    and bookings[previous]['to_time'] > bookings[i]['from_time']:
+                conflicts[i] = 'Time slot overlaps another item of the request'
+            else:
+                previous = i
+        accepted = [i for i in range(len(bookings)) if i not in conflicts]
+        if not accepted:
+            return dc.BulkBooking([], self._booking_conflicts(conflicts))
+
+        timeslot_ids = self.session.execute(
+            select(sa.func.nextval('timeslots_id_seq')).select_from(sa.func.generate_series(1, len(accepted)))
+        ).scalars().all()
+        self.session.execute(
+            sa.insert(models.TimeSlot).values([
+                dict(
+                    id=timeslot_id,
+                    from_time=bookings[i]['from_time'],
+                    to_time=bookings[i]['to_time'],
+                    locked=True,
+                ) for i, timeslot_id in zip(accepted, timeslot_ids)
+            ])
+        )
+        # Bookings racing with other transactions are skipped by the exclusion constraint
+        rows: list[Row] = self.session.execute(
+            postgresql.insert(models.Playback).values([
+                dict(
+                    adspot_id=bookings[i]['adspot_id'],
+                    timeslot_id=timeslot_id,
+                    creative_id=bookings[i]['creative_id'],
+                    status=bookings[i]['status'],
+                    smart_contract=bookings[i]['smart_contract'],
+                ) for i, timeslot_id in zip(accepted, timeslot_ids)
+            ]).on_conflict_do_nothing().returning(
+                models.Playback.id,
+                models.Playback.adspot_id,
+                models.Playback.timeslot_id,
+                models.Playback.creative_id,
+                cast(models.Playback.status, sa.String),
+                models.Playback.smart_contract,
+                models.Playback.processed_at,
+            )
+        ).all()
+        booked = {row.timeslot_id: row for row in rows}
+        skipped_timeslot_ids = []
+        for i, timeslot_id in zip(accepted, timeslot_ids):
+            if timeslot_id not in booked:
+                conflicts[i] = 'Time slot is already booked'
+                skipped_timeslot_ids.append(timeslot_id)
+        if skipped_timeslot_ids:
+            self.session.execute(
+                delete(models.TimeSlot).where(models.TimeSlot.id.in_(skipped_timeslot_ids))
+            )
+        if self.context.slot_index is not None:
+            self.context.slot_index.add(self.session, *(
+                dc.Booking(
+                    row.adspot_id,
+                    row.id,
+                    row.timeslot_id,
+                    bookings[i]['from_time'],
+                    bookings[i]['to_time'],
+                    True,
+                ) for i, timeslot_id in zip(accepted, timeslot_ids)
+                if (row := booked.get(timeslot_id)) is not None
+            ))
+        self.session.commit()
+        return dc.BulkBooking(
+            [
+                self._from_columns(dc.PlaybackRaw)(booked[timeslot_id])
+                for timeslot_id in timeslot_ids if timeslot_id in booked
+            ],
+            self._booking_conflicts(conflicts),
+        )
+
+    @staticmethod
+    def _booking_conflicts(conflicts: dict[int, str]) -> list['dc.BookingConflict']:
+        return [dc.BookingConflict(i, message) for i, message in sorted(conflicts.items())]
+
     def register_advertiser(self, login: str, wallet_ref: str, name: str = None):
         advertiser = models.Advertiser(login, wallet_ref, name)
         self.session.add(advertiser)
@@ -626,6 +1238,14 @@ class MS:
         return advertiser
 
     def authorize(self, login: str, wallet_ref: str = None) -> 'dc.UserWeb':
+        """
+        The advertiser of `login`, registered or given `wallet_ref` if needed.
+        Writes are only flushed: they are committed, and the user cached, by the caller.
+        """
+        user: Optional['dc.UserWeb'] = self.context.identity_cache.get(login)
+        if user is not None and user.wallet_ref == wallet_ref:
+            return user
+
         advertiser = self.session.query(
             models.Advertiser
         ).filter(
@@ -636,6 +1256,7 @@ class MS:
             advertiser = self.register_advertiser(login, wallet_ref, )
         elif advertiser.wallet_ref != wallet_ref:
             advertiser.wallet_ref = wallet_ref
+            self.session.flush()
 
         return dc.UserWeb(
             advertiser.id,
@@ -643,3 +1264,69 @@ class MS:
             advertiser.name,
             advertiser.wallet_ref,
         )
+
+
+class AsyncMS:
+    """
+    Awaitable facade over `MS`.
+    Every sync method of `MS` becomes a coroutine executed by `runner`.
+    """
+
+    def __init__(self, ms: 'MS', runner: Callable[[Callable[[], Any]], Awaitable[Any]]):
+        self.ms = ms
+        self.__runner = runner
+
+    @classmethod
+    def from_async_session(
+            cls,
+            session_: AsyncSession,
+            context_: Optional['root.Context'] = None,
+            request_user: Optional['dc.RequestUser'] = None,
+            user: Optional['dc.UserWeb'] = None
+    ) -> 'AsyncMS':
+        """Native asyncio driver: `MS` runs on the `AsyncSession` greenlet."""
+        ms = MS(session_.sync_session, context_, request_user, user)
+        return cls(ms, lambda fn: session_.run_sync(lambda _: fn()))
+
+    @classmethod
+    def inline(cls, ms: 'MS') -> 'AsyncMS':
+        """Blocking driver: `MS` runs directly on the event loop."""
+        async def runner(fn):
+            return fn()
+        return cls(ms, runner)
+
+    @classmethod
+    def in_executor(cls, ms: 'MS', executor: 'MSExecutor') -> 'AsyncMS':
+        """Blocking driver: `MS` runs in the DB-pool-sized thread pool."""
+        return cls(ms, executor.run)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.ms, name)
+        if not callable(attr) or asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.__runner(lambda: attr(*args, **kwargs))
+        return call
+
+    async def stream(self, method: str, *args, **kwargs) -> AsyncIterator[list]:
+        """
+        Iterate a `MS.stream_*` generator, fetching every batch through `runner`.
+        """
+        batches: Iterator[list] = await self.__runner(lambda: getattr(self.ms, method)(*args, **kwargs))
+        while batch := await self.__runner(lambda: next(batches, None)):
+            yield batch
+
+    async def get_user(self) -> Optional['dc.UserWeb']:
+        return await self.__runner(lambda: self.ms.user)
+
+    async def add_creative(
+            self,
+            name: str,
+            file: str,
+            filename: str,
+            description: str,
+    ):
+        uploaded = await self.ms.upload_creative(file, filename)
+        if uploaded is not None:
+            await self.save_creative(name, description, *uploaded)
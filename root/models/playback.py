@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Enum
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Enum, Index, text, event, DDL, FetchedValue
+from sqlalchemy.dialects.postgresql import TSRANGE, ExcludeConstraint
 
 from root import models
 import root.enums as enums
@@ -6,15 +7,40 @@ import root.enums as enums
 
 class Playback(models.Base):
     __tablename__ = 'playbacks'
+    __table_args__ = (
+        Index(
+            'ix_playbacks_pending',
+            'timeslot_id',
+            postgresql_where=text('smart_contract IS NOT NULL AND processed_at IS NULL'),
+        ),
+        Index(
+            'ix_playbacks_leased_by',
+            'leased_by',
+            postgresql_where=text('leased_by IS NOT NULL'),
+        ),
+        ExcludeConstraint(
+            ('adspot_id', '='),
+            ('booked_during', '&&'),
+            name='playbacks_booked_during_excl',
+            using='gist',
+        ),
+    )
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
-    adspot_id = Column(Integer, ForeignKey('adspots.id'), nullable=False)
-    timeslot_id = Column(Integer, ForeignKey('timeslots.id'), nullable=False)
-    creative_id = Column(Integer, ForeignKey('creatives.id'), nullable=False)
+    adspot_id = Column(Integer, ForeignKey('adspots.id'), nullable=False, index=True)
+    timeslot_id = Column(Integer, ForeignKey('timeslots.id'), nullable=False, index=True)
+    creative_id = Column(Integer, ForeignKey('creatives.id'), nullable=False, index=True)
     status = Column(Enum(enums.PlaybackStatus))
     smart_contract = Column(String)
     taken_at = Column(DateTime)
     processed_at = Column(DateTime)
+    # [from_time, to_time) of the timeslot, no two bookings of an adspot overlap.
+    # Derived from the timeslot by the triggers of BOOKED_DURING_DDL
+    booked_during = Column(TSRANGE, nullable=False, server_default=FetchedValue())
+    # Dispatcher holding the pending task, until the lease expires unless renewed by its heartbeat
+    leased_by = Column(String)
+    leased_until = Column(DateTime)
+    heartbeat_at = Column(DateTime)
 
     def __init__(
             self,
@@ -36,3 +62,102 @@ class Playback(models.Base):
             self.status = None
         self.smart_contract = smart_contract
         self.processed_at = processed_at
+
+
+# The exclusion constraint compares adspot_id, an integer, with a gist index
+event.listen(
+    models.Base.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'),
+)
+
+BOOKED_DURING_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION playbacks_set_booked_during() RETURNS trigger AS $$
+    BEGIN
+        SELECT tsrange(from_time, to_time) INTO NEW.booked_during
+        FROM timeslots WHERE id = NEW.timeslot_id;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER playbacks_set_booked_during
+    BEFORE INSERT OR UPDATE OF timeslot_id, booked_during ON playbacks
+    FOR EACH ROW EXECUTE FUNCTION playbacks_set_booked_during()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION timeslots_update_booked_during() RETURNS trigger AS $$
+    BEGIN
+        UPDATE playbacks SET booked_during = tsrange(NEW.from_time, NEW.to_time)
+        WHERE timeslot_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER timeslots_update_booked_during
+    AFTER UPDATE OF from_time, to_time ON timeslots
+    FOR EACH ROW EXECUTE FUNCTION timeslots_update_booked_during()
+    """,
+]
+# Announces changed bookings on the playback_changes channel, listened to by the dispatcher and the slot index.
+# NOTIFY payloads are delivered on commit, duplicates within a transaction are folded
+PLAYBACK_CHANGES_DDL = [
+    """
+    CREATE OR REPLACE FUNCTION notify_playback_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM pg_notify('playback_changes', json_build_object(
+                'playback_id', OLD.id, 'adspot_id', OLD.adspot_id)::text);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM pg_notify('playback_changes', json_build_object(
+                'playback_id', NEW.id, 'adspot_id', NEW.adspot_id)::text);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION notify_timeslot_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('playback_changes', json_build_object(
+            'playback_id', playbacks.id, 'adspot_id', playbacks.adspot_id)::text)
+        FROM playbacks WHERE playbacks.timeslot_id = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER playbacks_notify_insert_delete
+    AFTER INSERT OR DELETE ON playbacks
+    FOR EACH ROW EXECUTE FUNCTION notify_playback_changed()
+    """,
+    # The dispatcher's own taken_at/processed_at marks are not announced
+    """
+    CREATE TRIGGER playbacks_notify_update
+    AFTER UPDATE ON playbacks
+    FOR EACH ROW WHEN (
+        OLD.smart_contract IS DISTINCT FROM NEW.smart_contract
+        OR OLD.adspot_id IS DISTINCT FROM NEW.adspot_id
+        OR OLD.timeslot_id IS DISTINCT FROM NEW.timeslot_id
+        OR OLD.creative_id IS DISTINCT FROM NEW.creative_id
+    )
+    EXECUTE FUNCTION notify_playback_changed()
+    """,
+    """
+    CREATE TRIGGER timeslots_notify_update
+    AFTER UPDATE OF from_time, to_time ON timeslots
+    FOR EACH ROW EXECUTE FUNCTION notify_timeslot_changed()
+    """,
+]
+for statement in BOOKED_DURING_DDL + PLAYBACK_CHANGES_DDL:
+    event.listen(Playback.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+# The timeslots triggers read playbacks, they can't outlive the table
+for trigger in ('timeslots_update_booked_during', 'timeslots_notify_update'):
+    event.listen(
+        Playback.__table__,
+        'after_drop',
+        DDL(f'DROP TRIGGER IF EXISTS {trigger} ON timeslots').execute_if(dialect='postgresql'),
+    )
@@ -9,8 +9,8 @@ class TimeSlot(models.Base):
     __tablename__ = 'timeslots'
 
     id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
-    from_time = Column(DateTime, nullable=False)
-    to_time = Column(DateTime, nullable=False)
+    from_time = Column(DateTime, nullable=False, index=True)
+    to_time = Column(DateTime, nullable=False, index=True)
     locked = Column(Boolean, nullable=False)
 
     def __init__(
@@ -0,0 +1,85 @@
+import contextlib
+from typing import Callable, Optional
+
+import psycopg2.extensions
+import sqlalchemy as sa
+from tornado.ioloop import IOLoop
+
+import root.log_lib as log_lib
+
+
+class PGListener:
+    """
+    LISTENs on `channels` on a dedicated connection polled by the IOLoop and passes
+    every notification to `on_notify(channel, payload)`.
+    `on_connect` runs whenever the connection is (re)established: notifications sent
+    while it was down are lost, so it should resynchronize whatever they maintain.
+    """
+
+    def __init__(
+            self,
+            engine: 'sa.engine.Engine',
+            channels: list[str],
+            on_notify: Callable[[str, str], None],
+            on_connect: Optional[Callable[[], None]] = None,
+            retry_interval: float = 5,
+    ):
+        self.engine = engine
+        self.channels = channels
+        self.on_notify = on_notify
+        self.on_connect = on_connect
+        self.retry_interval = retry_interval
+        self.__connection: Optional['psycopg2.extensions.connection'] = None
+        self.__fd: Optional[int] = None
+        self.__logger = None
+
+    @property
+    def logger(self) -> 'log_lib.Logger':
+        if self.__logger is None:
+            self.__logger = log_lib.get_logger(self.__class__.__name__)
+        return self.__logger
+
+    def start(self) -> None:
+        dbapi_connection = None
+        try:
+            connection = self.engine.raw_connection()
+            connection.detach()
+            dbapi_connection = connection.connection
+            dbapi_connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with dbapi_connection.cursor() as cursor:
+                for channel in self.channels:
+                    cursor.execute(f'LISTEN {channel}')
+            if self.on_connect is not None:
+                self.on_connect()
+        except Exception as e:
+            self.logger.warning(f'Listener is not started: {e}')
+            if dbapi_connection is not None:
+                dbapi_connection.close()
+            IOLoop.current().call_later(self.retry_interval, self.start)
+            return
+        self.__connection = dbapi_connection
+        self.__fd = dbapi_connection.fileno()
+        IOLoop.current().add_handler(self.__fd, self.__on_read, IOLoop.READ)
+        self.logger.info(f'Listening on {", ".join(self.channels)}')
+
+    def __on_read(self, fd: int, _):
+        try:
+            self.__connection.poll()
+        except Exception as e:
+            self.logger.warning(f'Listener is disconnected: {e}')
+            self.stop()
+            IOLoop.current().call_later(self.retry_interval, self.start)
+            return
+        while self.__connection.notifies:
+            notify = self.__connection.notifies.pop(0)
+            try:
+                self.on_notify(notify.channel, notify.payload)
+            except Exception as e:
+                self.logger.exception(f'Failed to handle {notify.channel} notification. {e}', exc_info=True)
+
+    def stop(self) -> None:
+        if self.__connection is not None:
+            IOLoop.current().remove_handler(self.__fd)
+            with contextlib.suppress(Exception):
+                self.__connection.close()
+            self.__connection = None
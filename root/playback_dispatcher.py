@@ -1,23 +1,71 @@
+import asyncio
+import json
+import os
 import signal
-import time
-from datetime import datetime
-from threading import Thread
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
 
-import requests
+import aiohttp
 
 import root
+from root.group_commit import GroupCommit
+from root.pg_listener import PGListener
+from root.scheduler import TaskScheduler
+
+CHANNEL = 'playback_changes'
 
 
 class PlaybackDispatcher:
-    ms: 'root.MS'
+    """
+    Delivers publish/stop webhooks of booked playbacks at their `call_at`.
+    Polled `dc.AdTask`s wait in a `TaskScheduler`; each due one is delivered as its own
+    asyncio task over a shared aiohttp session, at most `concurrency` at once.
+    Deliveries to one adspot keep their order, so a slow or hung endpoint
+    only delays its own adspot.
+    With `listen` the schedule of an adspot is refreshed as soon as the `playbacks`/`timeslots`
+    triggers announce a change to it, the full poll then being a slow safety net.
+    Polled tasks are leased to this dispatcher, so several of them split the load:
+    the leases are renewed every `heartbeat_interval` and expire `lease_ttl` after
+    the last renewal, when the next poll of another dispatcher takes them over.
+    A task is only sent while its lease outlasts the request timeout.
+    Deliveries completing within `complete_window` are marked done with one committed UPDATE.
+    """
 
     def __init__(self):
         self.alive = False
-        self.__loop_thread = Thread(
-            target=self.component_loop,
-            name='PlaybackDispatcherLoop'
+        self.concurrency: int = root.context.dispatcher_concurrency
+        self.request_timeout: float = root.context.dispatcher_request_timeout
+        self.listen: bool = root.context.dispatcher_listen
+        self.worker_id: str = root.context.dispatcher_worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_ttl: float = root.context.dispatcher_lease_ttl
+        self.heartbeat_interval: float = root.context.dispatcher_heartbeat_interval
+        self.lease_batch_size: int = root.context.dispatcher_lease_batch_size
+        poll_interval = root.context.dispatcher_safety_poll_interval if self.listen \
+            else root.context.dispatcher_poll_interval
+        if self.lease_ttl <= self.heartbeat_interval + self.request_timeout:
+            # Right before a renewal the lease would not cover a delivery
+            raise ValueError('dispatcher_lease_ttl must exceed dispatcher_heartbeat_interval '
+                             'plus dispatcher_request_timeout')
+        # Expired leases of other dispatchers are only taken over by a full poll
+        self.poll_interval: float = min(poll_interval, self.lease_ttl)
+        self.poll_window: float = max(root.context.dispatcher_poll_window, self.poll_interval * 2)
+        self.scheduler = TaskScheduler()
+        self.completions = GroupCommit(
+            self.mark_complete,
+            root.context.dispatcher_complete_window,
+            root.context.dispatcher_complete_batch_size,
         )
         self.__logger = None
+        self.__wake: Optional[asyncio.Event] = None
+        self.__poll_now = True
+        self.__changed_adspot_ids: set[int] = set()
+        self.__lease_lock: Optional[asyncio.Lock] = None
+        self.__lease_deadlines: dict[int, float] = {}
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__http: Optional[aiohttp.ClientSession] = None
+        self.__in_flight: dict[tuple[int, bool], asyncio.Task] = {}
+        self.__adspot_locks: dict[int, asyncio.Lock] = {}
         self.near = root.Near()
 
     @property
@@ -28,64 +76,254 @@ class PlaybackDispatcher:
 
     def start(self):
         self.alive = True
-        self.add_signals()
-        self.__loop_thread.start()
 
     def serve(self):
-        while self.alive:
-            time.sleep(1)
+        asyncio.run(self.run())
 
     def add_signals(self):
         # Base SIG handlers
+        loop = asyncio.get_running_loop()
         for sig in (signal.SIGTERM, signal.SIGINT):
-            signal.signal(sig, lambda _, __: self.stop())
+            loop.add_signal_handler(sig, self.stop)
 
     def stop(self):
         self.alive = False
-        self.__loop_thread.join()
+        if self.__wake is not None:
+            self.__wake.set()
+
+    async def run(self):
+        self.alive = True
+        self.__wake = asyncio.Event()
+        self.__semaphore = asyncio.Semaphore(self.concurrency)
+        self.__lease_lock = asyncio.Lock()
+        self.add_signals()
+        listener = None
+        if self.listen:
+            listener = PGListener(
+                root.context.load_db_controller().engine,
+                [CHANNEL],
+                self.on_notify,
+                self.on_connect,
+            )
+            listener.start()
+        async with aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+        ) as self.__http:
+            dispatching = asyncio.create_task(self.dispatch_due())
+            heartbeat = asyncio.create_task(self.heartbeat())
+            await self.poll()
+            if listener is not None:
+                listener.stop()
+            # Unfinished tasks stay unmarked, their leases are released for the other dispatchers
+            self.scheduler.close()
+            await dispatching
+            heartbeat.cancel()
+            for task in list(self.__in_flight.values()):
+                task.cancel()
+            await asyncio.gather(heartbeat, *self.__in_flight.values(), return_exceptions=True)
+            # Delivered tasks queued for marking are still committed
+            await self.completions.close()
+            await self.release_leases()
+
+    def on_connect(self):
+        # Changes may have been missed while disconnected
+        self.__poll_now = True
+        self.__wake.set()
+
+    def on_notify(self, _, payload: str):
+        self.__changed_adspot_ids.add(json.loads(payload)['adspot_id'])
+        self.__wake.set()
 
-    def component_loop(self):
+    async def poll(self):
+        loop = asyncio.get_running_loop()
+        next_poll_at = loop.time()
         while self.alive:
-            self.component_iteration()
-            time.sleep(5)
+            adspot_ids, self.__changed_adspot_ids = self.__changed_adspot_ids, set()
+            try:
+                if self.__poll_now or loop.time() >= next_poll_at:
+                    self.__poll_now = False
+                    next_poll_at = loop.time() + self.poll_interval
+                    await self.component_iteration()
+                elif adspot_ids:
+                    await self.component_iteration(adspot_ids)
+            except Exception as e:
+                self.logger.exception(f'Failed to fetch ad tasks. {e}', exc_info=True)
+            self.__wake.clear()
+            if self.__changed_adspot_ids or self.__poll_now:
+                continue
+            try:
+                await asyncio.wait_for(self.__wake.wait(), max(next_poll_at - loop.time(), 0))
+            except asyncio.TimeoutError:
+                pass
 
-    def component_iteration(self):
+    async def heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                async with self.__lease_lock:
+                    renewed_at = loop.time()
+                    playback_ids = await self.run_blocking(self.__renew_leases)
+                    self.__set_leases(playback_ids, renewed_at)
+            except Exception as e:
+                self.logger.exception(f'Failed to renew leases. {e}', exc_info=True)
+
+    def __renew_leases(self) -> list[int]:
         with root.context.sc as sc:
-            self.ms = root.MS(sc.session)
-            ad_tasks = self.ms.allocate_pending_playbacks()
-            if ad_tasks:
-                self.logger.info(f'Fetched {len(ad_tasks)} ad tasks')
-            for ad_task in ad_tasks:
-                while datetime.utcnow() < ad_task.call_at:
-                    time.sleep(.1)
-                self.process_task(ad_task)
+            playback_ids = root.MS(sc.session).renew_leases(self.worker_id, self.lease_ttl)
+            # Leases are only held once committed, a failed commit raises
+            sc.commit()
+            return playback_ids
+
+    def __set_leases(self, playback_ids: list[int], leased_at: float):
+        """Leases held since `leased_at` are `playback_ids`, all the others are lost."""
+        held = set(playback_ids)
+        deadline = leased_at + self.lease_ttl
+        self.__lease_deadlines = {playback_id: deadline for playback_id in held}
+        for key, _, ad_task in self.scheduler.pending():
+            if ad_task.playback_id not in held:
+                self.scheduler.cancel(key)
+                self.logger.warning(f'Playback {ad_task.playback_id} lease is lost, task is cancelled')
+
+    async def release_leases(self):
+        def release():
+            with root.context.sc as sc:
+                return root.MS(sc.session).release_leases(self.worker_id)
 
-    def process_task(self, ad_task: 'root.dc.AdTask'):
-        ok = True
         try:
-            if ad_task.api_url:
-                r: 'requests.Response' = requests.post(
-                    ad_task.api_url,
-                    json=ad_task.config.to_web()
+            released = await self.run_blocking(release)
+            self.logger.info(f'Released {released} leases of {self.worker_id}')
+        except Exception as e:
+            self.logger.exception(f'Failed to release leases. {e}', exc_info=True)
+
+    @staticmethod
+    async def run_blocking(fn: Callable[[], Any]) -> Any:
+        if root.context.executor is not None:
+            return await root.context.executor.run(fn)
+        return await asyncio.get_running_loop().run_in_executor(None, fn)
+
+    async def component_iteration(self, adspot_ids: Optional[set[int]] = None):
+        """
+        Reconcile the schedule with the tasks due within the poll window,
+        of `adspot_ids` only if given, leasing them.
+        """
+        from_dt = datetime.utcnow()
+        to_dt = from_dt + timedelta(seconds=self.poll_window)
+
+        def allocate():
+            with root.context.sc as sc:
+                ad_tasks = root.MS(sc.session).allocate_pending_playbacks(
+                    from_dt, to_dt, adspot_ids, self.worker_id, self.lease_ttl, self.lease_batch_size
                 )
-                if r.status_code < 400:
-                    self.logger.info(
-                        f'Playback {ad_task.playback_id} was sent to {ad_task.api_url}.'
-                        f'File: {ad_task.config.name}'
-                    )
-                else:
-                    ok = False
-                    self.logger.warning(
-                        f'Failed to sent task to {ad_task.api_url}. '
-                        f'Status: {r.status_code}. Response: {r.content}'
-                    )
+                # Tasks are only leased once committed, a failed commit raises and none is scheduled
+                sc.commit()
+                return ad_tasks
+
+        async with self.__lease_lock:
+            leased_at = asyncio.get_running_loop().time()
+            ad_tasks = await self.run_blocking(allocate)
+            for ad_task in ad_tasks:
+                self.__lease_deadlines[ad_task.playback_id] = leased_at + self.lease_ttl
+        fetched = set()
+        new_tasks = 0
+        for ad_task in ad_tasks:
+            key = (ad_task.playback_id, ad_task.primarily)
+            fetched.add(key)
+            if key in self.__in_flight:
+                continue
+            new_tasks += key not in self.scheduler
+            self.scheduler.add(key, ad_task.call_at, ad_task)
+        # Playbacks deleted or moved out of the window since they were fetched
+        for key, _, ad_task in self.scheduler.pending():
+            anchor = ad_task.config.start_date if ad_task.primarily else ad_task.config.end_date
+            if key not in fetched and from_dt <= anchor <= to_dt \
+                    and (adspot_ids is None or ad_task.ad_spot_id in adspot_ids):
+                self.scheduler.cancel(key)
+                self.logger.info(f'Playback {ad_task.playback_id} task is cancelled')
+        if new_tasks:
+            self.logger.info(f'Fetched {new_tasks} ad tasks. Scheduler: {self.scheduler.stats}')
+        if new_tasks >= self.lease_batch_size:
+            # More tasks may be due, lease them on the next round
+            self.__poll_now = True
+
+    async def dispatch_due(self):
+        async for ad_task, _ in self.scheduler:
+            key = (ad_task.playback_id, ad_task.primarily)
+            task = asyncio.create_task(self.dispatch(ad_task))
+            self.__in_flight[key] = task
+            task.add_done_callback(lambda _, key_=key: self.__in_flight.pop(key_, None))
+
+    async def dispatch(self, ad_task: 'root.dc.AdTask'):
+        lock = self.__adspot_locks.setdefault(ad_task.ad_spot_id, asyncio.Lock())
+        async with lock:
+            ok = await self.process_task(ad_task)
+        if ok:
+            await self.complete_task(ad_task)
+
+    def lease_holds(self, ad_task: 'root.dc.AdTask', duration: float) -> bool:
+        """
+        The lease of the task surely outlasts the next `duration` seconds.
+        Otherwise another dispatcher may take the task over meanwhile, it is skipped.
+        """
+        remaining = self.__lease_deadlines.get(ad_task.playback_id, 0) - asyncio.get_running_loop().time()
+        if remaining > duration:
+            return True
+        self.logger.warning(f'Playback {ad_task.playback_id} lease expires in {remaining:.1f}s, task is skipped')
+        return False
+
+    async def process_task(self, ad_task: 'root.dc.AdTask') -> bool:
+        if not ad_task.api_url:
+            return self.lease_holds(ad_task, 0)
+        try:
+            async with self.__semaphore:
+                if not self.lease_holds(ad_task, self.request_timeout):
+                    return False
+                lateness = (datetime.utcnow() - ad_task.call_at).total_seconds()
+                async with self.__http.post(ad_task.api_url, json=ad_task.config.to_web()) as r:
+                    content = await r.read()
         except Exception as e:
-            ok = False
             self.logger.exception(
-                f'Failed to sent task to {ad_task.api_url}. {e}', exc_info=True
+                f'Failed to sent task to {ad_task.api_url}. {e!r}', exc_info=True
             )
+            return False
+        if r.status < 400:
+            self.logger.info(
+                f'Playback {ad_task.playback_id} was sent to {ad_task.api_url} '
+                f'{lateness * 1000:.1f}ms late. File: {ad_task.config.name}'
+            )
+            return True
+        self.logger.warning(
+            f'Failed to sent task to {ad_task.api_url}. '
+            f'Status: {r.status}. Response: {content}'
+        )
+        return False
 
-        if ok:
-            self.ms.mark_task_complete(ad_task)
-            if not ad_task.primarily:
-                self.near.transfer_funds(ad_task.playback_id)
+    async def mark_complete(self, ad_tasks: list['root.dc.AdTask']) -> set[int]:
+        """Mark `ad_tasks` still leased done, returns their playback ids."""
+        def mark_complete():
+            with root.context.sc as sc:
+                playback_ids = root.MS(sc.session).mark_tasks_complete(ad_tasks, self.worker_id)
+                sc.commit()
+                return playback_ids
+
+        completed = set(await self.run_blocking(mark_complete))
+        for ad_task in ad_tasks:
+            self.__lease_deadlines.pop(ad_task.playback_id, None)
+        return completed
+
+    async def complete_task(self, ad_task: 'root.dc.AdTask'):
+        try:
+            completed: set[int] = await self.completions.submit(ad_task)
+            if ad_task.playback_id not in completed:
+                self.logger.warning(
+                    f'Playback {ad_task.playback_id} lease is lost, task is not marked complete'
+                )
+            elif not ad_task.primarily:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.near.transfer_funds, ad_task.playback_id
+                )
+        except Exception as e:
+            self.logger.exception(
+                f'Failed to complete playback {ad_task.playback_id} task. {e}', exc_info=True
+            )
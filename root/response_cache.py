@@ -0,0 +1,49 @@
+import hashlib
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, ORMExecuteState
+
+import root.data_classes as dc
+from root.cache import TTLCache
+
+
+class ResponseCache(TTLCache):
+    """
+    Serialized responses of public endpoints with their ETags.
+    Cleared when a session commits changes to one of the watched tables.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: Optional[float] = None):
+        super().__init__(max_size, ttl)
+        self.tables: set[str] = set()
+
+    def make_response(self, body: bytes) -> 'dc.CachedResponse':
+        return dc.CachedResponse(f'"{hashlib.sha1(body).hexdigest()}"', body)
+
+    def watch(self, *models_) -> None:
+        if not self.tables:
+            sa.event.listen(Session, 'after_flush', self.__after_flush)
+            sa.event.listen(Session, 'do_orm_execute', self.__do_orm_execute)
+            sa.event.listen(Session, 'after_commit', self.__after_commit)
+        self.tables.update(model.__tablename__ for model in models_)
+
+    def __touches(self, instances) -> bool:
+        return any(
+            getattr(instance, '__tablename__', None) in self.tables
+            for instance in instances
+        )
+
+    def __after_flush(self, session: Session, _):
+        if self.__touches(session.new) or self.__touches(session.dirty) or self.__touches(session.deleted):
+            session.info['response_cache_stale'] = True
+
+    def __do_orm_execute(self, state: ORMExecuteState):
+        if (state.is_update or state.is_delete or state.is_insert) \
+                and state.bind_mapper is not None \
+                and state.bind_mapper.local_table.name in self.tables:
+            state.session.info['response_cache_stale'] = True
+
+    def __after_commit(self, session: Session):
+        if session.info.pop('response_cache_stale', False):
+            self.clear()
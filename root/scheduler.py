@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime
+from typing import Any, AsyncIterator, Hashable, Optional
+
+import root.data_classes as dc
+
+
+class TaskScheduler:
+    """
+    Min-heap of items due at naive UTC datetimes.
+    Iterating it sleeps exactly until the earliest item is due and yields `(item, lateness)`,
+    lateness being the seconds the item was yielded after its due time.
+    Items are keyed: adding an existing key reschedules it, cancelled entries are
+    skipped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self):
+        self.dispatched = 0
+        self.max_lateness = 0.
+        self.total_lateness = 0.
+        self.__heap: list[list] = []
+        self.__entries: dict[Hashable, list] = {}
+        self.__counter = itertools.count()
+        self.__changed: Optional[asyncio.Event] = None
+        self.__closed = False
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.__entries
+
+    @property
+    def changed(self) -> asyncio.Event:
+        if self.__changed is None:
+            self.__changed = asyncio.Event()
+        return self.__changed
+
+    def add(self, key: Hashable, due_at: datetime, item: Any) -> None:
+        entry = self.__entries.get(key)
+        if entry is not None and entry[0] == due_at:
+            entry[-1] = item
+            return
+        self.cancel(key)
+        entry = [due_at, next(self.__counter), key, item]
+        self.__entries[key] = entry
+        heapq.heappush(self.__heap, entry)
+        if self.__heap[0] is entry:
+            self.changed.set()
+
+    def cancel(self, key: Hashable) -> Optional[Any]:
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return None
+        item, entry[-1] = entry[-1], None
+        entry[2] = None
+        return item
+
+    def pending(self) -> list[tuple[Hashable, datetime, Any]]:
+        return [(key, entry[0], entry[-1]) for key, entry in self.__entries.items()]
+
+    def close(self) -> None:
+        self.__closed = True
+        self.changed.set()
+
+    @property
+    def stats(self) -> 'dc.SchedulerStats':
+        return dc.SchedulerStats(
+            len(self.__entries),
+            self.dispatched,
+            self.max_lateness,
+            self.total_lateness / self.dispatched if self.dispatched else 0.,
+        )
+
+    async def __aiter__(self) -> AsyncIterator[tuple[Any, float]]:
+        while not self.__closed:
+            while self.__heap and self.__heap[0][2] is None:
+                heapq.heappop(self.__heap)
+            self.changed.clear()
+            if not self.__heap:
+                await self.changed.wait()
+                continue
+            delay = (self.__heap[0][0] - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due_at, _, key, item = heapq.heappop(self.__heap)
+            del self.__entries[key]
+            lateness = -delay
+            self.dispatched += 1
+            self.total_lateness += lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+            yield item, lateness
@@ -0,0 +1,215 @@
+import bisect
+import datetime
+import json
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from tornado.ioloop import IOLoop
+
+import root.data_classes as dc
+from root.pg_listener import PGListener
+
+CHANNEL = 'slot_index'
+
+
+def horizon() -> datetime.datetime:
+    """Start of the current UTC day, bookings ended before it are not indexed."""
+    return datetime.datetime.combine(datetime.datetime.utcnow().date(), datetime.time())
+
+
+class SlotIndex:
+    """
+    Booked time ranges of every adspot, kept in memory as arrays sorted by start.
+    Sessions queue changes with `add`/`remove`; they are applied after commit
+    and published with NOTIFY to the other processes (see `SlotIndexListener`).
+    Only bookings ending after `horizon` are kept, so the index answers
+    for ranges starting at the horizon or later only (see `covers`).
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.horizon = datetime.datetime.min
+        self.__lock = threading.Lock()
+        self.__starts: dict[int, list[datetime.datetime]] = {}
+        self.__bookings: dict[int, list['dc.Booking']] = {}
+        self.__max_duration: dict[int, datetime.timedelta] = {}
+        self.__by_playback_id: dict[int, 'dc.Booking'] = {}
+        self.__watching = False
+
+    def __len__(self) -> int:
+        return len(self.__by_playback_id)
+
+    def load(self, bookings: Iterable['dc.Booking'], horizon_: datetime.datetime = datetime.datetime.min) -> None:
+        """Replace the index by `bookings`, every booking ending after `horizon_`."""
+        with self.__lock:
+            self.__starts.clear()
+            self.__bookings.clear()
+            self.__max_duration.clear()
+            self.__by_playback_id.clear()
+            for booking in sorted(bookings, key=lambda b: b.from_time):
+                self.__insert(booking)
+            self.horizon = horizon_
+            self.ready = True
+
+    def prune(self, horizon_: datetime.datetime) -> int:
+        """Drop the bookings ended by `horizon_`, returns how many."""
+        with self.__lock:
+            if horizon_ <= self.horizon:
+                return 0
+            self.horizon = horizon_
+            ended = [booking for booking in self.__by_playback_id.values() if booking.to_time <= horizon_]
+            for booking in ended:
+                self.__delete(booking.playback_id)
+            return len(ended)
+
+    def covers(self, from_time: datetime.datetime) -> bool:
+        """The index holds every booking that can overlap a range starting at `from_time`."""
+        return self.ready and from_time >= self.horizon
+
+    def __insert(self, booking: 'dc.Booking') -> None:
+        self.__delete(booking.playback_id)
+        starts = self.__starts.setdefault(booking.adspot_id, [])
+        bookings = self.__bookings.setdefault(booking.adspot_id, [])
+        i = bisect.bisect_right(starts, booking.from_time)
+        starts.insert(i, booking.from_time)
+        bookings.insert(i, booking)
+        duration = booking.to_time - booking.from_time
+        if duration > self.__max_duration.get(booking.adspot_id, datetime.timedelta()):
+            self.__max_duration[booking.adspot_id] = duration
+        self.__by_playback_id[booking.playback_id] = booking
+
+    def __delete(self, playback_id: int) -> None:
+        booking = self.__by_playback_id.pop(playback_id, None)
+        if booking is None:
+            return
+        starts = self.__starts[booking.adspot_id]
+        bookings = self.__bookings[booking.adspot_id]
+        i = bisect.bisect_left(starts, booking.from_time)
+        while bookings[i].playback_id != playback_id:
+            i += 1
+        del starts[i]
+        del bookings[i]
+
+    def apply(self, change: dict[str, Any]) -> None:
+        with self.__lock:
+            if change['op'] == 'add':
+                booking: dict[str, Any] = change['booking']
+                self.__insert(dc.Booking(**dict(
+                    booking,
+                    from_time=datetime.datetime.fromisoformat(booking['from_time']),
+                    to_time=datetime.datetime.fromisoformat(booking['to_time']),
+                )))
+            elif change['op'] == 'remove':
+                self.__delete(change['playback_id'])
+
+    def bookings(
+            self,
+            adspot_id: int,
+            from_time: datetime.datetime,
+            to_time: datetime.datetime,
+    ) -> list['dc.Booking']:
+        """Bookings of the adspot starting within [from_time, to_time)."""
+        with self.__lock:
+            starts = self.__starts.get(adspot_id, [])
+            return self.__bookings.get(adspot_id, [])[
+                bisect.bisect_left(starts, from_time):bisect.bisect_left(starts, to_time)
+            ]
+
+    def is_free(self, adspot_id: int, from_time: datetime.datetime, to_time: datetime.datetime) -> bool:
+        """
+        No booking of the adspot overlaps [from_time, to_time).
+        Only bookings starting less than the longest booking before `from_time` can reach into it.
+        """
+        with self.__lock:
+            starts = self.__starts.get(adspot_id, [])
+            bookings = self.__bookings.get(adspot_id, [])
+            lo = bisect.bisect_right(starts, from_time - self.__max_duration.get(adspot_id, datetime.timedelta()))
+            hi = bisect.bisect_left(starts, to_time)
+            return not any(booking.to_time > from_time for booking in bookings[lo:hi])
+
+    def add(self, session: Session, *bookings: 'dc.Booking') -> None:
+        self.__queue(session, [{'op': 'add', 'booking': booking.to_web()} for booking in bookings])
+
+    def remove(self, session: Session, playback_id: int) -> None:
+        self.__queue(session, [{'op': 'remove', 'playback_id': playback_id}])
+
+    def __queue(self, session: Session, changes: list[dict[str, Any]]) -> None:
+        if not changes:
+            return
+        if not self.__watching:
+            sa.event.listen(Session, 'after_commit', self.__after_commit)
+            sa.event.listen(Session, 'after_rollback', self.__after_rollback)
+            self.__watching = True
+        session.info.setdefault('slot_index_changes', []).extend(changes)
+        if session.get_bind().dialect.name == 'postgresql':
+            # Delivered to the listeners on commit only, one round trip for all changes
+            session.execute(
+                sa.text(f"SELECT pg_notify('{CHANNEL}', payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+                {'payloads': [json.dumps(change) for change in changes]},
+            )
+
+    def __after_commit(self, session: Session):
+        for change in session.info.pop('slot_index_changes', ()):
+            self.apply(change)
+
+    @staticmethod
+    def __after_rollback(session: Session):
+        session.info.pop('slot_index_changes', None)
+
+
+class SlotIndexListener(PGListener):
+    """
+    Applies `SlotIndex` changes of the other processes.
+    The index is reloaded off the IOLoop whenever the connection is (re)established,
+    so no change is missed while it is down. Until the reload completes the index
+    is not used, and notifications received meanwhile are applied after it.
+    """
+
+    def __init__(
+            self,
+            index: 'SlotIndex',
+            engine: 'sa.engine.Engine',
+            load_bookings: Callable[[datetime.datetime], Iterable['dc.Booking']],
+            retry_interval: float = 5,
+    ):
+        super().__init__(engine, [CHANNEL], self.__on_notify, self.__on_connect, retry_interval)
+        self.index = index
+        self.load_bookings = load_bookings
+        self.__loading: Optional[list[dict[str, Any]]] = None
+        self.__loads = 0
+
+    def __on_connect(self):
+        self.index.ready = False
+        self.__loading = []
+        self.__loads += 1
+        IOLoop.current().add_callback(self.__load, self.__loads)
+
+    async def __load(self, load: int):
+        horizon_ = horizon()
+        try:
+            bookings = await IOLoop.current().run_in_executor(None, self.load_bookings, horizon_)
+        except Exception as e:
+            if load != self.__loads:
+                return
+            self.logger.exception(f'Slot index is not loaded. {e}', exc_info=True)
+            # Reconnecting loads it again
+            self.stop()
+            IOLoop.current().call_later(self.retry_interval, self.start)
+            return
+        if load != self.__loads:
+            # Superseded by the load of a later connection
+            return
+        self.index.load(bookings, horizon_)
+        changes, self.__loading = self.__loading, None
+        for change in changes:
+            self.index.apply(change)
+        self.logger.info(f'Slot index loaded: {len(self.index)} bookings')
+
+    def __on_notify(self, _, payload: str):
+        change = json.loads(payload)
+        if self.__loading is not None:
+            self.__loading.append(change)
+        else:
+            self.index.apply(change)
@@ -1,10 +1,15 @@
-from datetime import datetime
+import base64
+import json
+from datetime import date, datetime, time, timedelta
 from pathlib import Path
+from typing import Any, Optional
 
 import aiofiles
 import aiohttp
 import pytz
 
+import root.exceptions as exceptions
+
 
 def proper_utc_date(iso_string: str) -> datetime:
     dt = datetime.fromisoformat(iso_string.removesuffix('Z'))
@@ -14,6 +19,17 @@ def proper_utc_date(iso_string: str) -> datetime:
     return dt
 
 
+def day_range(date_from: date, date_to: Optional[date] = None) -> tuple[datetime, datetime]:
+    """
+    Half-open `[date_from 00:00, date_to + 1 day 00:00)` bounds of whole days,
+    comparable against indexed datetime columns.
+    """
+    return (
+        datetime.combine(date_from, time()),
+        datetime.combine(date_to or date_from, time()) + timedelta(days=1),
+    )
+
+
 async def file_download(url: str, dir_to_save: str):
     file_path = Path(
         dir_to_save,
@@ -26,3 +42,17 @@ async def file_download(url: str, dir_to_save: str):
                 await f.write(await resp.read())
                 await f.close()
     return str(file_path), resp.status
+
+
+def encode_cursor(values: list[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except ValueError:
+        raise exceptions.APIError('Invalid cursor')
+    if not isinstance(values, list):
+        raise exceptions.APIError('Invalid cursor')
+    return values
@@ -0,0 +1,114 @@
+# Rows/sec of MS.get_playbacks: ORM entities (previous implementation) vs Core column projection
+
+import datetime
+from argparse import ArgumentParser
+from time import perf_counter
+
+import sqlalchemy as sa
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import root.data_classes as dc
+import root.models as models
+from root.main_section import MS
+
+
+def seed(session: Session, playbacks: int):
+    session.execute(sa.insert(models.Publisher).values(id=1, name='Publisher', wallet_ref='w', service_ref='s'))
+    session.execute(sa.insert(models.AdSpotType).values(id=1, name='Billboard'))
+    session.execute(sa.insert(models.Advertiser).values(id=1, login='login', wallet_ref='wallet'))
+    session.execute(sa.insert(models.AdSpot), [
+        dict(id=i, name=f'AdSpot {i}', publisher_id=1, spot_type_id=1, price=1.5,
+             publish_url='https://publish', stop_url='https://stop', delay_before_publish=0, active=True)
+        for i in range(1, 21)
+    ])
+    session.execute(sa.insert(models.Creative), [
+        dict(id=i, advert_id=1, nft_ref='nft', name=f'Creative {i}', path=f'/data/{i}.png', url=f'/{i}.png')
+        for i in range(1, 101)
+    ])
+    start = datetime.datetime(2022, 3, 1)
+    session.execute(sa.insert(models.TimeSlot), [
+        dict(id=i, from_time=start + datetime.timedelta(minutes=i),
+             to_time=start + datetime.timedelta(minutes=i, seconds=30), locked=True)
+        for i in range(1, playbacks + 1)
+    ])
+    session.execute(sa.insert(models.Playback), [
+        dict(id=i, adspot_id=i % 20 + 1, timeslot_id=i, creative_id=i % 100 + 1, smart_contract='contract')
+        for i in range(1, playbacks + 1)
+    ])
+    session.commit()
+
+
+def legacy_get_playbacks(session: Session) -> list['dc.Playback']:
+    rows = session.execute(
+        select(
+            models.Playback,
+            models.Creative,
+            models.CreativeType,
+            models.TimeSlot,
+            models.AdSpot,
+            models.AdSpotType
+        ).join(
+            models.Creative,
+            models.Playback.creative_id == models.Creative.id,
+        ).outerjoin(
+            models.CreativeType,
+            models.Creative.creative_type_id == models.CreativeType.id,
+        ).join(
+            models.Advertiser,
+            models.Creative.advert_id == models.Advertiser.id,
+        ).join(
+            models.TimeSlot,
+            models.Playback.timeslot_id == models.TimeSlot.id,
+        ).join(
+            models.AdSpot,
+            models.Playback.adspot_id == models.AdSpot.id,
+        ).join(
+            models.AdSpotType,
+            models.AdSpot.spot_type_id == models.AdSpotType.id,
+        )
+    ).all()
+    return [
+        dc.Playback(
+            row.Playback.id,
+            row.AdSpot.name,
+            row.TimeSlot.from_time,
+            row.TimeSlot.to_time,
+            row.Creative.advert_id,
+            row.Creative.name,
+            row.Creative.description,
+            row.Creative.url,
+            row.Creative.path,
+            row.Playback.status and row.Playback.status.value,
+            row.Playback.smart_contract,
+            row.AdSpot.price,
+            row.TimeSlot.locked,
+            row.AdSpotType.name,
+            row.Playback.taken_at,
+            row.Playback.processed_at,
+        ) for row in rows
+    ]
+
+
+def measure(name: str, engine: 'sa.engine.Engine', fetch):
+    with Session(engine) as session:
+        started = perf_counter()
+        rows = fetch(session)
+        elapsed = perf_counter() - started
+    print(f'{name:<18} {len(rows):>8} rows  {elapsed:7.3f}s  {len(rows) / elapsed:>10.0f} rows/sec')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='MS read path benchmark')
+    parser.add_argument('--db', required=True, help='PostgreSQL URL of a scratch database, seeded from scratch')
+    parser.add_argument('--playbacks', type=int, default=100_000)
+    args = parser.parse_args()
+
+    engine = sa.create_engine(args.db)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as session_:
+        seed(session_, args.playbacks)
+
+    measure('ORM entities', engine, legacy_get_playbacks)
+    measure('Core projection', engine, lambda session: MS(session).get_playbacks())
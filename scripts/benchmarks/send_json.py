@@ -0,0 +1,63 @@
+# Benchmark of send_json bodies: escape.json_encode with Deeply fallback vs root.serializer
+
+import datetime
+import json
+from argparse import ArgumentParser
+from timeit import timeit
+
+from deeply import Deeply
+from tornado import escape
+
+import root.data_classes as dc
+import root.serializer as serializer
+
+
+def legacy_dumps(data) -> bytes:
+    try:
+        body = escape.json_encode(data)
+    except TypeError:
+        data = Deeply._Deeply__deep_dict(data, Deeply.rules)  # noqa
+        body = escape.json_encode(data)
+    return body.encode('utf-8')
+
+
+def day_timeslots() -> list['dc.TimeSlot']:
+    day = datetime.datetime(2022, 3, 1)
+    return [
+        dc.TimeSlot(
+            i if i % 2 else None,
+            day + datetime.timedelta(minutes=i),
+            day + datetime.timedelta(minutes=i + 1),
+            bool(i % 2),
+            1.5,
+        ) for i in range(24 * 60)
+    ]
+
+
+def playbacks(amount: int) -> list['dc.Playback']:
+    now = datetime.datetime(2022, 3, 1)
+    return [
+        dc.Playback(
+            i, f'AdSpot {i % 20}', now, now + datetime.timedelta(minutes=1), i % 50,
+            f'Creative {i}', 'Description', f'https://metaads.team/data/{i}.png',
+            f'/home/backdev/data/{i}.png', 'signed', f'contract_{i}', 3, True,
+            'Billboard', now, None,
+        ) for i in range(amount)
+    ]
+
+
+def bench(name: str, payload, number: int):
+    data = {'data': payload}
+    assert json.loads(legacy_dumps(data)) == json.loads(serializer.dumps(data))
+    legacy = timeit(lambda: legacy_dumps(data), number=number) / number
+    fast = timeit(lambda: serializer.dumps(data), number=number) / number
+    print(f'{name:<24} legacy {legacy * 1000:8.2f}ms  serializer {fast * 1000:8.2f}ms  x{legacy / fast:.1f}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='send_json encoding benchmark')
+    parser.add_argument('--playbacks', type=int, default=5000)
+    parser.add_argument('--number', '-n', type=int, default=20)
+    args = parser.parse_args()
+    bench('1440-slot day', day_timeslots(), args.number)
+    bench(f'{args.playbacks} playbacks', playbacks(args.playbacks), args.number)
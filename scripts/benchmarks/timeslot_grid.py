@@ -0,0 +1,64 @@
+# Day grid of MS.get_timeslots_by_adspot_id: per-minute scan of the bookings (previous implementation)
+# vs a single sweep over the sorted bookings
+
+import datetime
+from argparse import ArgumentParser
+from time import perf_counter
+
+import root.data_classes as dc
+import root.utils as utils
+from root.main_section import MS
+
+DAY = datetime.date(2022, 3, 1)
+PRICE = 1.5
+
+
+def legacy_minute_grid(
+        booked: list['dc.TimeSlot'],
+        day_from: datetime.datetime,
+        day_to: datetime.datetime,
+        price: float,
+) -> list['dc.TimeSlot']:
+    time_slots = []
+    for i in range((day_to - day_from) // datetime.timedelta(minutes=1)):
+        dt = day_from + datetime.timedelta(minutes=i)
+        locked_ts = next((ts for ts in booked if dt in ts), None)
+        if locked_ts:
+            time_slots.append(locked_ts)
+        else:
+            time_slots.append(dc.TimeSlot(
+                None,
+                dt,
+                dt + datetime.timedelta(minutes=1),
+                False,
+                price
+            ))
+    return time_slots
+
+
+def bookings(day_from: datetime.datetime, every: int) -> list['dc.TimeSlot']:
+    if not every:
+        return []
+    return [
+        dc.TimeSlot(i, day_from + datetime.timedelta(minutes=i),
+                    day_from + datetime.timedelta(minutes=i, seconds=30), True, PRICE)
+        for i in range(0, 24 * 60, every)
+    ]
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Timeslot day grid benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    day_from_, day_to_ = utils.day_range(DAY)
+    for name, every in (('empty', 0), ('half-booked', 2), ('fully booked', 1)):
+        booked_ = bookings(day_from_, every)
+        assert legacy_minute_grid(booked_, day_from_, day_to_, PRICE) == \
+            MS._minute_grid(booked_, day_from_, day_to_, PRICE)
+        for impl_name, impl in (('legacy', legacy_minute_grid), ('sweep', MS._minute_grid)):
+            started = perf_counter()
+            for _ in range(args.repeat):
+                impl(booked_, day_from_, day_to_, PRICE)
+            elapsed = (perf_counter() - started) / args.repeat
+            print(f'{name:<13} {len(booked_):>5} bookings  {impl_name:<7} {elapsed * 1000:9.2f} ms/day')
@@ -0,0 +1,74 @@
+# Plans and timings of the timeslots-by-date filter: cast(from_time, Date) (previous implementation)
+# vs the half-open [day, day + 1) range predicate, over a year of one-minute slots
+
+import datetime
+from argparse import ArgumentParser
+from time import perf_counter
+
+import sqlalchemy as sa
+from sqlalchemy import select, cast, Date
+from sqlalchemy.orm import Session
+
+import root.models as models
+import root.utils as utils
+
+START = datetime.datetime(2022, 1, 1)
+DAY = datetime.date(2022, 7, 1)
+
+
+def seed(engine: 'sa.engine.Engine', days: int):
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(sa.text(
+            'INSERT INTO timeslots (from_time, to_time, locked) '
+            'SELECT t, t + interval \'1 minute\', true '
+            'FROM generate_series(:start, :start + :days * interval \'1 day\' - interval \'1 minute\', '
+            'interval \'1 minute\') AS t'
+        ), dict(start=START, days=days))
+        connection.execute(sa.text('ANALYZE timeslots'))
+
+
+def plan_nodes(plan: dict) -> list[str]:
+    node = plan['Node Type']
+    if 'Index Name' in plan:
+        node += f' using {plan["Index Name"]}'
+    return [node] + [n for sub_plan in plan.get('Plans', []) for n in plan_nodes(sub_plan)]
+
+
+def measure(name: str, engine: 'sa.engine.Engine', q: 'sa.sql.Select', repeat: int):
+    with Session(engine) as session:
+        compiled = q.compile(engine)
+        plan = session.connection().exec_driver_sql(
+            f'EXPLAIN (ANALYZE, FORMAT JSON) {compiled}', compiled.params
+        ).scalar()[0]
+        started = perf_counter()
+        for _ in range(repeat):
+            rows = session.execute(q).all()
+        elapsed = (perf_counter() - started) / repeat
+    print(f'{name:<8} {len(rows):>6} rows  {elapsed * 1000:8.2f} ms/query  '
+          f'{", ".join(plan_nodes(plan["Plan"]))}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Timeslots by date benchmark')
+    parser.add_argument('--db', required=True, help='PostgreSQL URL of a scratch database, seeded from scratch')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    engine_ = sa.create_engine(args.db)
+    seed(engine_, args.days)
+
+    columns = (models.TimeSlot.id, models.TimeSlot.from_time, models.TimeSlot.to_time, models.TimeSlot.locked)
+    day_from, day_to = utils.day_range(DAY)
+    measure('cast', engine_, select(*columns).filter(cast(models.TimeSlot.from_time, Date) == DAY), args.repeat)
+    measure('range', engine_, select(*columns).filter(
+        models.TimeSlot.from_time >= day_from,
+        models.TimeSlot.from_time < day_to,
+    ), args.repeat)
+    week_from, week_to = utils.day_range(DAY, DAY + datetime.timedelta(days=6))
+    measure('range 7d', engine_, select(*columns).filter(
+        models.TimeSlot.from_time >= week_from,
+        models.TimeSlot.from_time < week_to,
+    ), args.repeat)
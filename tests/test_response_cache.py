@@ -0,0 +1,40 @@
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+import root
+from root.handlers import BaseHandler, non_authorized
+from root.log_lib import get_logger
+
+
+@non_authorized
+class CachedHandler(BaseHandler):
+    async def get(self):
+        await self.send_cached_json(self.get_data)
+
+    @staticmethod
+    async def get_data():
+        return [{'id': 1}]
+
+
+class SendCachedJsonTest(AsyncHTTPTestCase):
+    def get_app(self):
+        root.context.response_cache.clear()
+        return Application(
+            [('/cached', CachedHandler)],
+            context=root.context,
+            logger=get_logger(__name__),
+        )
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.fetch('/cached')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'{"data":[{"id":1}]}')
+
+        response = self.fetch('/cached', headers={'If-None-Match': response.headers['Etag']})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(response.body, b'')
+
+    def test_stale_etag_gets_the_body(self):
+        response = self.fetch('/cached', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'{"data":[{"id":1}]}')